@@ -13,28 +13,11 @@ FILE="/Users/zyu/Desktop/repo/financial-master-database/backend/data/checkpoints
 [ -f "$FILE" ] && rm "$FILE" && echo "$FILE deleted" || echo "$FILE does not exist"
 
  
-echo "--- Start running pipeline_coin_price_overview_updater---"
-pipeline_start_time=$(date +%s)
-/Users/zyu/Desktop/repo/financial-master-database/backend/venv/bin/python3 /Users/zyu/Desktop/repo/financial-master-database/backend/pipeline_coin_price_overview_updater.py
-pipeline_end_time=$(date +%s)
-echo "--- Finish running coin pipeline_coin_price_overview_updater---"
-echo "--- pipeline_coin_price_overview_updater Duration: $((pipeline_end_time - pipeline_start_time)) seconds ---"
-
- 
-echo "--- Start running pipeline_coin_hourly_price_updater---"
-pipeline_start_time=$(date +%s)
-/Users/zyu/Desktop/repo/financial-master-database/backend/venv/bin/python3 /Users/zyu/Desktop/repo/financial-master-database/backend/pipeline_coin_hourly_price_updater.py
-pipeline_end_time=$(date +%s)
-echo "--- Finish running pipeline_coin_hourly_price_updater---"
-echo "--- pipeline_coin_hourly_price_updater Duration: $((pipeline_end_time - pipeline_start_time)) seconds ---"
-
- 
-echo "--- Start running pipeline_coin_signal_updater_coint---"
-pipeline_start_time=$(date +%s)
-/Users/zyu/Desktop/repo/financial-master-database/backend/venv/bin/python3 /Users/zyu/Desktop/repo/financial-master-database/backend/pipeline_coin_signal_updater_coint.py
-pipeline_end_time=$(date +%s)
-echo "--- Finish running pipeline_coin_signal_updater_coint---"
-echo "--- pipeline_coin_signal_updater_coint Duration: $((pipeline_end_time - pipeline_start_time)) seconds ---"
+# price download, overview load, hourly prices, stonewell + coint signals and api output as one dependency graph;
+# per-stage timing and row counts are written to data/run_reports
+echo "--- Start running pipeline_runner coin_daily---"
+/Users/zyu/Desktop/repo/financial-master-database/backend/venv/bin/python3 /Users/zyu/Desktop/repo/financial-master-database/backend/pipeline_runner.py coin_daily
+echo "--- Finish running pipeline_runner coin_daily---"
 
  
 # Track the end time of the entire script
@@ -0,0 +1,76 @@
+'''
+Import-time budget check for the pipeline entry points
+  python scripts/import_time_check.py            # table + exit 1 if an entry point is over budget
+  python scripts/import_time_check.py --verbose  # also the heaviest modules of each entry point
+
+Only the module-level imports of each src/pipeline_*.py are run (the pipelines themselves are not), in a fresh
+interpreter with `python -X importtime`; the best of RUNS is compared with its budget.
+Heavy libraries (statsmodels, twilio, binance, tqdm) are imported on first use, keep it that way.
+'''
+import ast
+import glob
+import os
+import re
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+RUNS = 3
+DEFAULT_BUDGET_MS = 600
+# entry points that legitimately need a heavy library at import time get their own budget
+BUDGETS_MS = {
+    'pipeline_manual_1.py': None, # imports the archived calc_utils package, not checked
+}
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def entry_point_imports(path):
+    with open(path, 'r') as file:
+        tree = ast.parse(file.read())
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+def measure(code):
+    '''returns (total import ms, {module: cumulative ms}) of one cold run'''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=SRC_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    total_us, modules = 0, {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules[name] = int(cumulative_us) / 1000
+        if indent == ' ':
+            # top-level import of the entry point
+            total_us += int(cumulative_us)
+    return total_us / 1000, modules
+
+def main(verbose=False):
+    over_budget = []
+    print(f"{'entry point':<50} {'import ms':>10} {'budget ms':>10}")
+    for path in sorted(glob.glob(os.path.join(SRC_DIR, 'pipeline_*.py'))):
+        name = os.path.basename(path)
+        budget = BUDGETS_MS.get(name, DEFAULT_BUDGET_MS)
+        if budget is None:
+            print(f"{name:<50} {'skipped':>10}")
+            continue
+        try:
+            runs = [measure(entry_point_imports(path)) for _ in range(RUNS)]
+        except RuntimeError as e:
+            print(f"{name:<50} {'failed':>10}  {e}")
+            over_budget.append(name)
+            continue
+        total_ms, modules = min(runs, key=lambda run: run[0])
+        flag = '' if total_ms <= budget else '  OVER BUDGET'
+        print(f"{name:<50} {total_ms:>10.0f} {budget:>10}{flag}")
+        if flag:
+            over_budget.append(name)
+        if verbose:
+            for module, ms in sorted(modules.items(), key=lambda item: -item[1])[:5]:
+                print(f"    {module:<46} {ms:>10.0f}")
+    if over_budget:
+        print(f"over budget: {over_budget}")
+    return 1 if over_budget else 0
+
+if __name__ == '__main__':
+    sys.exit(main(verbose='--verbose' in sys.argv))
@@ -13,6 +13,8 @@ FILE="/Users/zyu/Desktop/repo/financial-master-database/backend/data/checkpoints
 FILE2="/Users/zyu/Desktop/repo/financial-master-database/backend/data/checkpoints/calc_pipeline.json"
 [ -f "$FILE" ] && rm "$FILE" && echo "$FILE deleted" || echo "$FILE does not exist"
 [ -f "$FILE2" ] && rm "$FILE2" && echo "$FILE2 deleted" || echo "$FILE2 does not exist"
+# per-sector checkpoints of the sharded coint pipeline
+rm -f /Users/zyu/Desktop/repo/financial-master-database/backend/data/checkpoints/calc_pipeline_*.json
 
 
 echo "--- Start running pipeline_stock_price_updater ---"
@@ -1,3 +1,5 @@
+-- superseded by pairs_spread_signal_calculator -> coin_pairs_spread / stock_pairs_spread (db.fetch_key_insights),
+-- kept as the baseline of: python -m utils.refactor_db_signal_updater spread
 with key_pairs as (
     select *, row_number() over (partition by symbol order by date desc) as rn
     from coin_historical_price
@@ -1,3 +1,5 @@
+-- superseded by utils/refactor_cycle_analytics.py: cycle_roi_analytics.compare_halves takes any number of
+-- cycles and loads the price matrix once (python -m utils.refactor_cycle_analytics for the benchmark)
 -- Calculate ROI for Bitcoin (BTC)
 WITH btc_roi AS (
     SELECT 
@@ -1,105 +1,60 @@
+-- price_in_btc and the 140 day SMA flags are precomputed per symbol/date in alt_analysis_historical_price_btc_metrics
+-- (utils.refactor_db_data_updater.btc_relative_metrics_db_refresher, refreshed by the pipeline_runner coin_daily alt_btc_metrics stage),
+-- so both queries are range scans of it instead of BTC joins and full history window scans
 create or replace temporary view ta_indicators2 as  
-with btc_prices as (
-    select symbol, date, close 
-    from alt_analysis_historical_price
-    where symbol = 'BTCUSDT'
-),
-in_btc_prices as (
-select a.symbol, a.date, a.close/b.close as price_in_btc
-from alt_analysis_historical_price a 
-join btc_prices b 
-on a.date=b.date
-), 
-add_ta as (
-select symbol, date, price_in_btc,
-avg(price_in_btc) over (partition by symbol order by date rows between 139 preceding and current row) as sma_140d
-from in_btc_prices
-order by symbol, date
-),
-eval_ta as (
-select *,
-max(date) over(partition by symbol) - min(date) over(partition by symbol) as data_points,
-case when price_in_btc >= sma_140d then 1 else 0 end as above_140d_sma 
-from add_ta
+with eval_ta as (
+select symbol, date, to_btc_above_140d_sma as above_140d_sma
+from alt_analysis_historical_price_btc_metrics
 where date between '2018-12-10' and '2019-08-30'	-- UPDATE DATE 
 ),
 ta_result as (
-select symbol, data_points,
+select symbol, max(date) - min(date) as data_points,
 (100*sum(above_140d_sma)::float / count(*)::float) as pct_above_140d_sma
 from eval_ta
-group by symbol,data_points)
+group by symbol)
 
 select *
 from ta_result 
 order by pct_above_140d_sma desc;
 
-with symbol_date_range as (
-    select symbol, date, close, volume, 
+with symbol_prices as (
+    select symbol, date, close, price_in_btc, 
 		   row_number() over(partition by symbol ORDER by date) as date_index, 
-           min(date) over(partition by symbol) as start_date, 
-           max(date) over(partition by symbol) as end_date,
-           min(close) over(partition by symbol) as cycle_low, 
-           max(close) over(partition by symbol) as cycle_high
-    from alt_analysis_historical_price
+           min(date) over w as start_date, 
+           max(date) over w as end_date,
+           min(close) over w as cycle_low, 
+           max(close) over w as cycle_high,
+           first_value(close) over w as init_price, 
+           last_value(close) over w as end_price,
+           first_value(price_in_btc) over w as init_price_in_btc,
+           last_value(price_in_btc) over w as end_price_in_btc
+    from alt_analysis_historical_price_btc_metrics
     where date between '2018-12-10' and '2019-08-30'	-- UPDATE DATE 
+    window w as (partition by symbol order by date rows between unbounded preceding and unbounded following)
 ),
-symbol_prices as (
-    select a.*, 
-           b.close as init_price, 
-           c.close as end_price,
-           (a.close) / b.close as rolling_roi,
-           btc_start.close as btc_init_price,
-           btc_end.close as btc_end_price
-    from symbol_date_range a 
-    join alt_analysis_historical_price b 
-    on a.symbol = b.symbol and a.start_date = b.date
-    join alt_analysis_historical_price c 
-    on a.symbol = c.symbol and a.end_date = c.date
-    join alt_analysis_historical_price btc_start
-    on btc_start.symbol = 'BTCUSDT' and a.start_date = btc_start.date
-    join alt_analysis_historical_price btc_end
-    on btc_end.symbol = 'BTCUSDT' and a.end_date = btc_end.date
-),
-peak_final_roi as (-- coins performances
+peak_final_roi as (-- coins performances, btc roi = coin roi / roi in btc
     select distinct 
            symbol as symbol, 
            round(init_price, 2) as initial_price, 
            round(end_price, 2) as ending_price,
            round(end_price / init_price, 2) as final_roi, 
-		   round(btc_end_price / btc_init_price, 2) as btc_final_roi, 
+		   round((end_price / init_price) / (end_price_in_btc / init_price_in_btc), 2) as btc_final_roi, 
            dense_rank() over (order by (end_price / init_price) desc) as roi_rank,
            round(cycle_high / cycle_low, 2) as peak_roi, 
            dense_rank() over (order by (cycle_high / cycle_low) desc) as peak_roi_rank
     from symbol_prices
     order by final_roi desc
 ),
-btc_prices as (
-    select symbol, date, close 
-    from alt_analysis_historical_price
-    where symbol = 'BTCUSDT'
-),
-rolling_roi as (
-    select a.*, 
-           b.close as btc_relative_start_price,
-           c.close as btc_relative_curr_price
-    from symbol_prices a 
-    left join btc_prices b
-    on a.start_date = b.date
-    left join btc_prices c
-    on a.date = c.date
-),
-rolling_roi_t1 as (
+rolling_roi_t1 as (-- coin roi / btc roi since the start date = price_in_btc / starting price_in_btc
 select symbol, date, date_index, start_date, end_date, 
-init_price, close, rolling_roi as alts_rolling_roi, 
-btc_relative_start_price, 
-btc_relative_curr_price, 
-btc_relative_curr_price/btc_relative_start_price as btc_relative_rolling_roi
-from rolling_roi
+init_price, close, close / init_price as alts_rolling_roi, 
+price_in_btc / init_price_in_btc as rolling_relative_roi
+from symbol_prices
 ),
 pct_below_btc_gain as (
 select symbol, start_date, end_date, count(*) as total_count,
-sum(case when alts_rolling_roi/btc_relative_rolling_roi > 1 then 1 else 0 end) as above_one_count,
-round((sum(case when alts_rolling_roi/btc_relative_rolling_roi > 1 then 1 else 0 end) * 100.0 / count(*)),0) as pct_above_one 
+sum(case when rolling_relative_roi > 1 then 1 else 0 end) as above_one_count,
+round((sum(case when rolling_relative_roi > 1 then 1 else 0 end) * 100.0 / count(*)),0) as pct_above_one 
 from rolling_roi_t1 
 group by symbol, start_date, end_date)
 
@@ -113,7 +68,7 @@ on a.symbol=c.symbol
 order by pct_above_140d_sma desc 
 
 
--- select a.symbol, date_index, alts_rolling_roi/btc_relative_rolling_roi as rolling_relative_roi, round(final_roi/btc_final_roi,1) as final_relative_roi
+-- select a.symbol, date_index, rolling_relative_roi, round(final_roi/btc_final_roi,1) as final_relative_roi
 -- from rolling_roi_t1 a 
 -- join peak_final_roi b
 -- on a.symbol=b.symbol
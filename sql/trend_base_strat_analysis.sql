@@ -1,42 +1,11 @@
-create or replace temporary view rsi as 
-with price_changes as (
-    select 
-        date, close,
-        lag(close) over (order by date) as prev_close,
-        close - lag(close) over (order by date) as price_change
-    from stock_historical_price
-    where symbol = 'DKS'
-),
-rsi_calculation as (
-    select date, close, price_change,
-        case when price_change > 0 then price_change else 0 end as gain,
-        case when price_change < 0 then abs(price_change) else 0 end as loss
-    from price_changes
-),
-avg_gains_losses as (
-    select date, close, price_change,
-        avg(gain) over (order by date rows between 13 preceding and current row) as avg_gain,
-        avg(loss) over (order by date rows between 13 preceding and current row) as avg_loss
-    from rsi_calculation
-)
-select date,
-    100 - (100 / (1 + avg_gain / nullif(avg_loss, 0))) as rsi
-from avg_gains_losses;
-
+-- rsi_14, ema_12 / ema_26 and the 50 / 200 day SMAs come from stock_indicators, refreshed for every symbol by
+-- pipeline_stock_price_updater.py (utils/refactor_indicator_engine.calculate_indicators).
+-- ema_12 / ema_26 are true exponential averages, the old query approximated them with rolling geometric means.
 with spy_sma as (
-    select date,
-        avg(close) over (order by date rows between 49 preceding and current row) as sma_50,
-        avg(close) over (order by date rows between 199 preceding and current row) as sma_200
-    from stock_historical_price
+    select date, sma_50, sma_200
+    from stock_indicators
     where symbol = 'XLY'
 ),
-macd as (
-    select date, close,
-        exp(sum(log(close)) over (order by date rows between 11 preceding and current row) / 12) as ema_12,
-        exp(sum(log(close)) over (order by date rows between 25 preceding and current row) / 26) as ema_26
-    from stock_historical_price
-    where symbol = 'DKS'
-),
 vwap as (
     select date, close, volume,
         sum(close * volume) over (order by date rows between unbounded preceding and current row) / 
@@ -45,10 +14,10 @@ vwap as (
     where symbol = 'DKS'
 ),
 indicators as (
-    select a.*, r.rsi, v.vwap, m.ema_12, m.ema_26,
+    select a.*, i.rsi_14 as rsi, v.vwap, i.ema_12, i.ema_26,
         s.sma_50 as spy_sma_50, s.sma_200 as spy_sma_200,
-        avg(a.close) over (order by a.date rows between 49 preceding and current row) as stock_sma_50,
-        avg(a.close) over (order by a.date rows between 199 preceding and current row) as stock_sma_200,
+        i.sma_50 as stock_sma_50,
+        i.sma_200 as stock_sma_200,
         ((a.open - lag(a.close) over (order by a.date)) / nullif(lag(a.close) over (order by a.date), 0)) * 100 as overnight_change_percent,
         ((a.close - a.open) / nullif(a.open, 0)) * 100 as day_change_percent,
         ((lead(a.close, 3) over (order by a.date) - a.open) / nullif(a.open, 0)) * 100 as change_3d_percent,
@@ -56,9 +25,8 @@ indicators as (
         ((lead(a.close, 7) over (order by a.date) - a.open) / nullif(a.open, 0)) * 100 as change_7d_percent
     from stock_historical_price a
     join spy_sma s on a.date = s.date
-    join macd m on a.date = m.date
+    join stock_indicators i on a.symbol = i.symbol and a.date = i.date
     join vwap v on a.date = v.date
-    join rsi r on a.date = r.date
     where a.symbol = 'DKS'
 )
 
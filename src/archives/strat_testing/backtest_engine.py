@@ -0,0 +1,177 @@
+import time
+import numpy as np
+import pandas as pd
+
+'''
+Backtest engine for the strat_utils.add_signals_* columns (price, opening_signal, closing_signal)
+  bars, trades = run_backtest(df)
+  summary = summarize_backtest(bars, trades)
+
+Rules (same as the original strat_test.py loop):
+  - an opening signal buys one tranche of sizing * init_cap if there is that much capital left
+  - a closing signal sells every open tranche
+Only bars with a signal can change the state, so the state machine walks those bars and every per-bar column
+(shares, capital, current value, account value, unrealized profit) is filled from them with numpy.
+'''
+
+def backtest_arrays(price, opening, closing, sizing=0.1, init_cap=100000.0, commission_perc=0):
+    '''
+    core of run_backtest on numpy arrays.
+    returns (per-bar dict of arrays, trades dict of arrays)
+    '''
+    price = np.asarray(price, dtype=float)
+    opening = np.asarray(opening, dtype=bool)
+    closing = np.asarray(closing, dtype=bool)
+    n = len(price)
+    tranche = sizing * init_cap
+    fee = commission_perc / 100
+
+    # state machine over signal bars only, bar 0 never trades
+    events = np.flatnonzero(opening[1:] | closing[1:]) + 1
+    state_bar, state_capital, state_shares, state_open = [0], [init_cap], [0.0], [0]
+    capital, shares, entries = init_cap, 0.0, []
+    trades = {'entry_index': [], 'exit_index': [], 'entry_price': [], 'sold_price': [], 'shares': []}
+    for i in events:
+        if opening[i] and capital >= tranche:
+            capital -= tranche * (1 + fee)
+            shares += tranche / price[i]
+            entries.append(i)
+        elif shares > 0 and closing[i]:
+            capital += shares * price[i] * (1 - fee)
+            trades['entry_index'].extend(entries)
+            trades['exit_index'].extend([i] * len(entries))
+            shares, entries = 0.0, []
+        else:
+            continue
+        state_bar.append(i)
+        state_capital.append(capital)
+        state_shares.append(shares)
+        state_open.append(len(entries))
+
+    # every bar carries the state of the last signal bar at or before it
+    last_state = np.searchsorted(state_bar, np.arange(n), side='right') - 1
+    shares = np.asarray(state_shares)[last_state]
+    capital = np.asarray(state_capital)[last_state]
+    open_positions = np.asarray(state_open)[last_state]
+    invested_dollars = open_positions * tranche
+    current_value = price * shares
+    bars = {
+        'invested_dollars': invested_dollars,
+        'open_positions': open_positions,
+        'shares': shares,
+        'capital': capital,
+        'current_value': current_value,
+        'account_value': current_value + capital,
+        'unrealized_profit': current_value - invested_dollars,
+    }
+
+    entry_index = np.asarray(trades['entry_index'], dtype=int)
+    exit_index = np.asarray(trades['exit_index'], dtype=int)
+    trade_shares = tranche / price[entry_index]
+    trades = {
+        'entry_index': entry_index,
+        'exit_index': exit_index,
+        'entry_price': price[entry_index],
+        'sold_price': price[exit_index],
+        # entry commission is paid out of capital on top of the tranche, same as account_value
+        'profit_loss': trade_shares * price[exit_index] * (1 - fee) - tranche * (1 + fee),
+        'invested_dollars': np.full(len(entry_index), tranche),
+        'shares': trade_shares,
+    }
+    return bars, trades
+
+def run_backtest(df, sizing=0.1, init_cap=100000.0, commission_perc=0):
+    '''df with price, opening_signal and closing_signal columns -> (df with the per-bar columns, trades df)'''
+    bars, trades = backtest_arrays(df['price'].to_numpy(), df['opening_signal'].to_numpy() == 1,
+                                   df['closing_signal'].to_numpy() == 1, sizing, init_cap, commission_perc)
+    df = df.assign(**bars)
+    return df, pd.DataFrame(trades)
+
+def max_drawdown(account_value):
+    '''largest peak to trough fall of the account value, as a fraction of the peak'''
+    peak = np.maximum.accumulate(account_value)
+    return float(np.max((peak - account_value) / peak)) if len(account_value) else 0.0
+
+def summarize_backtest(df, trades, init_cap=100000.0, dca_times=10):
+    '''trade statistics plus strategy, HODL and DCA returns'''
+    price = df['price'].to_numpy()
+    profit_loss = trades['profit_loss'].to_numpy()
+    profits = profit_loss[profit_loss > 0]
+    losses = -profit_loss[profit_loss <= 0]
+
+    # HODL - buy all at start, DCA - buy dca_times times
+    hodl_value = init_cap / price[0] * price[-1]
+    dca_shares = (init_cap / dca_times / price[np.arange(dca_times) * (len(price) // dca_times)]).sum()
+    return {
+        'total_trades': len(profit_loss),
+        'profit_trades': len(profits),
+        'loss_trades': len(losses),
+        'avg_profit': profits.mean() if len(profits) else 0.0,
+        'avg_loss': losses.mean() if len(losses) else 0.0,
+        'total_profit_amount': profits.sum(),
+        'total_loss_amount': losses.sum(),
+        'profit_factor': profits.sum() / losses.sum() if losses.sum() else np.inf,
+        'win_rate': len(profits) / len(profit_loss) if len(profit_loss) else np.nan,
+        'strat_return': df['account_value'].iloc[-1] - init_cap,
+        'strat_return_perc': (df['account_value'].iloc[-1] - init_cap) / init_cap,
+        'max_drawdown': max_drawdown(df['account_value'].to_numpy()),
+        'hodl_return': hodl_value - init_cap,
+        'hodl_return_perc': (hodl_value - init_cap) / init_cap,
+        'hodl_avg_price': price[0],
+        'dca_return': dca_shares * price[-1] - init_cap,
+        'dca_return_perc': (dca_shares * price[-1] - init_cap) / init_cap,
+        'dca_avg_price': init_cap / dca_shares,
+    }
+
+def _loop_backtest(df, sizing=0.1, init_cap=100000.0, commission_perc=0):
+    # the original strat_test.py bar loop (per-share accounting fixed), kept for the benchmark below
+    df = df.copy()
+    for col in ['invested_dollars', 'shares', 'capital', 'current_value', 'account_value', 'unrealized_profit']:
+        df[col] = 0.0
+    df['open_positions'] = 0
+    df.loc[df.index[0], 'capital'] = init_cap
+    df.loc[df.index[0], 'account_value'] = init_cap
+    for i in range(1, len(df)):
+        for col in ['invested_dollars', 'open_positions', 'capital', 'shares']:
+            df.loc[df.index[i], col] = df.loc[df.index[i-1], col]
+        if df.loc[df.index[i], 'opening_signal'] == 1 and df.loc[df.index[i], 'capital'] >= sizing*init_cap:
+            df.loc[df.index[i], 'invested_dollars'] += sizing * init_cap
+            df.loc[df.index[i], 'open_positions'] += 1
+            df.loc[df.index[i], 'capital'] -= sizing * init_cap * (1 + commission_perc/100)
+            df.loc[df.index[i], 'shares'] += sizing * init_cap / df.loc[df.index[i], 'price']
+        elif (df.loc[df.index[i], 'shares'] > 0) and (df.loc[df.index[i], 'closing_signal'] == 1):
+            df.loc[df.index[i], 'capital'] += df.loc[df.index[i], 'shares'] * df.loc[df.index[i], 'price'] * (1 - commission_perc/100)
+            df.loc[df.index[i], 'invested_dollars'] = 0
+            df.loc[df.index[i], 'open_positions'] = 0
+            df.loc[df.index[i], 'shares'] = 0
+        df.loc[df.index[i], 'current_value'] = df.loc[df.index[i], 'price'] * df.loc[df.index[i], 'shares']
+        df.loc[df.index[i], 'unrealized_profit'] = df.loc[df.index[i], 'current_value'] - df.loc[df.index[i], 'invested_dollars']
+        df.loc[df.index[i], 'account_value'] = df.loc[df.index[i], 'current_value'] + df.loc[df.index[i], 'capital']
+    return df
+
+if __name__ == '__main__':
+    # benchmark on synthetic SPY daily (30 years) and BTC 30 minute (2 years) random walks
+    import os
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from strat_utils import add_signals_simple_strat
+
+    rng = np.random.default_rng(0)
+    series = {
+        'SPY daily': pd.DataFrame({'price': 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, 7560)))},
+                                  index=pd.bdate_range('1995-01-02', periods=7560)),
+        'BTC 30min': pd.DataFrame({'price': 20000 * np.exp(np.cumsum(rng.normal(0, 0.004, 35040)))},
+                                  index=pd.date_range('2022-01-01', periods=35040, freq='30min')),
+    }
+    for name, df in series.items():
+        df = add_signals_simple_strat(df)
+        start = time.perf_counter()
+        bars, trades = run_backtest(df)
+        engine_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        reference = _loop_backtest(df)
+        loop_seconds = time.perf_counter() - start
+        columns = ['invested_dollars', 'open_positions', 'shares', 'capital', 'current_value', 'account_value', 'unrealized_profit']
+        assert np.allclose(bars[columns].to_numpy(float), reference[columns].to_numpy(float))
+        print(f"{name}: {len(df)} bars, {len(trades)} trades, loop {loop_seconds:.2f}s, engine {engine_seconds * 1000:.1f}ms "
+              f"({loop_seconds / engine_seconds:,.0f}x)")
@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from financial_database.backend.archives.strat_utils import sma_crossover_grid
+from financial_database.backend.archives.strat_testing.backtest_engine import backtest_arrays, max_drawdown
+
+'''
+SMA crossover window sweep
+  results = sweep_sma_windows(df['price'].to_numpy(), short_windows=range(10, 60, 5), long_windows=range(80, 260, 20))
+  results.head()   # best (short_window, long_window) first
+
+All SMAs come from one cumulative sum and the crossovers of every combination from one 3D array
+(strat_utils.sma_crossover_grid); the combinations are backtested on all cores.
+'''
+
+SWEEP_METRICS = ['return_perc', 'max_drawdown', 'trades', 'win_rate', 'profit_factor']
+
+_grid = None
+
+def _init_worker(price, opening, closing):
+    global _grid
+    _grid = (price, opening, closing)
+
+def _backtest_combinations(combinations, backtest_kwargs):
+    price, opening, closing = _grid
+    init_cap = backtest_kwargs.get('init_cap', 100000.0)
+    rows = []
+    for i, j in combinations:
+        bars, trades = backtest_arrays(price, opening[i, j], closing[i, j], **backtest_kwargs)
+        profit_loss = trades['profit_loss']
+        losses = -profit_loss[profit_loss <= 0].sum()
+        rows.append((i, j,
+                     bars['account_value'][-1] / init_cap - 1,
+                     max_drawdown(bars['account_value']),
+                     len(profit_loss),
+                     (profit_loss > 0).mean() if len(profit_loss) else np.nan,
+                     profit_loss[profit_loss > 0].sum() / losses if losses else np.inf))
+    return rows
+
+def sweep_sma_windows(price, short_windows, long_windows, rank_by='return_perc', ascending=False,
+                      backtest_kwargs=None, max_workers=None):
+    '''
+    backtest the SMA crossover strategy for every short_window < long_window combination.
+    returns one row per combination (short_window, long_window and SWEEP_METRICS) sorted by rank_by
+    '''
+    price = np.ascontiguousarray(price, dtype=float)
+    short_windows, long_windows = list(short_windows), list(long_windows)
+    opening, closing = sma_crossover_grid(price, short_windows, long_windows)
+    combinations = [(i, j) for i, short_window in enumerate(short_windows)
+                    for j, long_window in enumerate(long_windows) if short_window < long_window]
+    backtest_kwargs = backtest_kwargs or {}
+    max_workers = min(max_workers or os.cpu_count() or 1, len(combinations))
+
+    if max_workers <= 1:
+        _init_worker(price, opening, closing)
+        rows = _backtest_combinations(combinations, backtest_kwargs)
+    else:
+        chunks = [combinations[k::max_workers] for k in range(max_workers)]
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(price, opening, closing)) as executor:
+            rows = [row for chunk_rows in executor.map(_backtest_combinations, chunks, [backtest_kwargs] * len(chunks))
+                    for row in chunk_rows]
+
+    results = pd.DataFrame(rows, columns=['short_index', 'long_index'] + SWEEP_METRICS)
+    results.insert(0, 'short_window', np.asarray(short_windows)[results.pop('short_index')])
+    results.insert(1, 'long_window', np.asarray(long_windows)[results.pop('long_index')])
+    results = results.sort_values(rank_by, ascending=ascending, ignore_index=True)
+    results.insert(0, 'rank', np.arange(1, len(results) + 1))
+    return results
+
+if __name__ == '__main__':
+    file = '.home/ec2-user/financial_database/backend/SPY_DAILY_data.csv'
+    df = pd.read_csv(file, parse_dates=['date']).sort_values('date')
+    print(sweep_sma_windows(df['price'].to_numpy(), range(10, 60, 5), range(80, 260, 20)).head(20))
@@ -1,6 +1,19 @@
 import pandas as pd
 import numpy as np
 import os
+from concurrent.futures import ProcessPoolExecutor
+from financial_database.backend.archives.strat_utils import sma_crossover_signals
+from financial_database.backend.archives.strat_testing.backtest_engine import backtest_arrays, max_drawdown
+
+'''
+Monte Carlo sample backtesting
+  results = evaluate_samples(df['price'].to_numpy(), length=1440, num_samples=5000)
+  print(summarize_samples(results))
+
+Samples are views into the one price array (no copies, no CSVs); the strategy runs on every sample on all cores.
+'''
+
+SAMPLE_METRICS = ['return_perc', 'max_drawdown', 'trades', 'win_rate', 'hodl_return_perc']
 
 def read_time_series(file_path):
     # Read the CSV file
@@ -11,40 +24,92 @@ def generate_samples(df, length, num_samples):
     # Automatically detect the start and end dates
     start_date = df['date'].min()
     end_date = df['date'].max()
-    
+
     # Ensure the dataframe is sorted by datetime
     df = df.sort_values(by='date').reset_index(drop=True)
-    
+
     total_length = len(df)
     samples = []
-    
+
     if length > total_length:
         raise ValueError("Length of each sample is greater than the total length of the time series data.")
-    
+
     for _ in range(num_samples):
-        start_index = np.random.randint(0, total_length - length)
+        start_index = np.random.randint(0, total_length - length + 1)
         sample = df.iloc[start_index:start_index + length]
         samples.append(sample)
-    
+
     return samples
 
 def save_samples_to_csv(samples):
     if not os.path.exists('samples'):
         os.makedirs('samples')
-        
+
     for i, sample in enumerate(samples):
         sample.to_csv(f'.home/ec2-user/financial_database/backend/sample_{i+1}.csv', index=False)
 
-# Example usage
-file_path = './btc.csv'
-length = 1440  # 30 days for 30mins candle
-num_samples = 5
+def draw_start_indices(total_length, length, num_samples, seed=None):
+    '''random sample starts, same range as generate_samples'''
+    if length > total_length:
+        raise ValueError("Length of each sample is greater than the total length of the time series data.")
+    return np.random.default_rng(seed).integers(0, total_length - length + 1, size=num_samples)
+
+_price = None
+
+def _init_worker(price):
+    global _price
+    _price = price
+
+def _evaluate_starts(starts, length, strategy, strategy_kwargs, backtest_kwargs):
+    init_cap = backtest_kwargs.get('init_cap', 100000.0)
+    rows = []
+    for start in starts:
+        sample = _price[start:start + length] # view, not a copy
+        opening, closing = strategy(sample, **strategy_kwargs)
+        bars, trades = backtest_arrays(sample, opening, closing, **backtest_kwargs)
+        profit_loss = trades['profit_loss']
+        rows.append((start,
+                     bars['account_value'][-1] / init_cap - 1,
+                     max_drawdown(bars['account_value']),
+                     len(profit_loss),
+                     (profit_loss > 0).mean() if len(profit_loss) else np.nan,
+                     sample[-1] / sample[0] - 1))
+    return rows
+
+def evaluate_samples(price, length, num_samples, strategy=sma_crossover_signals, strategy_kwargs=None,
+                     backtest_kwargs=None, max_workers=None, seed=None):
+    '''
+    backtest strategy(sample) -> (opening, closing) on num_samples random windows of length bars.
+    returns one row per sample: start_index and SAMPLE_METRICS
+    '''
+    price = np.ascontiguousarray(price, dtype=float)
+    starts = draw_start_indices(len(price), length, num_samples, seed)
+    args = (length, strategy, strategy_kwargs or {}, backtest_kwargs or {})
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if max_workers == 1:
+        _init_worker(price)
+        rows = _evaluate_starts(starts, *args)
+    else:
+        # a few chunks per worker keeps the cores busy without pickling per sample
+        chunks = np.array_split(starts, max_workers * 4)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(price,)) as executor:
+            rows = [row for chunk_rows in executor.map(_evaluate_starts, chunks, *[[arg] * len(chunks) for arg in args])
+                    for row in chunk_rows]
+    return pd.DataFrame(rows, columns=['start_index'] + SAMPLE_METRICS)
 
-# Read the time series data
-df = read_time_series(file_path)
+def summarize_samples(results, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    '''distribution of every sample metric, plus how often the strategy made money / beat holding'''
+    summary = results[SAMPLE_METRICS].describe(percentiles=list(quantiles)).T
+    summary['prob_positive'] = (results[SAMPLE_METRICS] > 0).mean()
+    summary.loc['return_perc', 'prob_beats_hodl'] = (results['return_perc'] > results['hodl_return_perc']).mean()
+    return summary
 
-# Generate samples
-samples = generate_samples(df, length, num_samples)
+if __name__ == '__main__':
+    file_path = './btc.csv'
+    length = 1440  # 30 days for 30mins candle
+    num_samples = 5000
 
-# Save samples to CSV
-save_samples_to_csv(samples)
+    df = read_time_series(file_path).sort_values(by='date')
+    results = evaluate_samples(df['price'].to_numpy(), length, num_samples)
+    print(summarize_samples(results))
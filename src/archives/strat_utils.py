@@ -1,8 +1,6 @@
 import numpy as np
 
-def add_signals_simple_strat(df):
-    short_window = 40
-    long_window = 100
+def add_signals_simple_strat(df, short_window=40, long_window=100):
 
     df['short_sma'] = df['price'].rolling(window=short_window, min_periods=1).mean()
     df['long_sma'] = df['price'].rolling(window=long_window, min_periods=1).mean()
@@ -26,9 +24,7 @@ def add_signals_simple_strat(df):
     
     return df
 
-def add_signals_bb_band(df):
-    short_window = 40
-    long_window = 100
+def add_signals_bb_band(df, short_window=40, long_window=100):
     
     df['opening_signal'] = 0
     df['closing_signal'] = 0
@@ -50,9 +46,7 @@ def add_signals_bb_band(df):
     return df
 
 
-def add_signals_spread_zero(df):
-    short_window = 40
-    long_window = 100
+def add_signals_spread_zero(df, short_window=40, long_window=100):
 
     df['short_sma'] = df['price'].rolling(window=short_window, min_periods=1).mean()
     df['long_sma'] = df['price'].rolling(window=long_window, min_periods=1).mean()
@@ -74,4 +68,37 @@ def add_signals_spread_zero(df):
         0
     )
     
-    return df
\ No newline at end of file
+    return df
+
+def sma_matrix(price, windows):
+    '''rolling means (min_periods=1) of price for every window, all from one cumulative sum -> (len(windows), len(price))'''
+    price = np.asarray(price, dtype=float)
+    windows = np.asarray(windows)[:, None]
+    csum = np.concatenate(([0.0], np.cumsum(price)))
+    n = np.arange(1, len(price) + 1)
+    return (csum[n] - csum[np.maximum(n - windows, 0)]) / np.minimum(n, windows)
+
+def sma_crossover_grid(price, short_windows, long_windows):
+    '''
+    sma_crossover_signals for every (short, long) window combination at once.
+    returns (opening, closing) bool arrays of shape (len(short_windows), len(long_windows), len(price))
+    '''
+    smas = sma_matrix(price, list(short_windows) + list(long_windows))
+    short_sma = smas[:len(short_windows), None, :]
+    long_sma = smas[None, len(short_windows):, :]
+    above = short_sma > long_sma
+    below = short_sma < long_sma
+    opening = np.zeros(above.shape, dtype=bool)
+    closing = np.zeros(above.shape, dtype=bool)
+    opening[:, :, 1:] = above[:, :, 1:] & ~above[:, :, :-1]
+    closing[:, :, 1:] = below[:, :, 1:] & ~below[:, :, :-1]
+    # crossovers are only taken from short_window + 1 on, like the shifted slice in add_signals_simple_strat
+    valid = np.arange(len(price))[None, :] > np.asarray(short_windows)[:, None]
+    opening &= valid[:, None, :]
+    closing &= valid[:, None, :]
+    return opening, closing
+
+def sma_crossover_signals(price, short_window=40, long_window=100):
+    '''add_signals_simple_strat on a numpy price array (e.g. a view into a longer series) -> (opening, closing) bool arrays'''
+    opening, closing = sma_crossover_grid(price, [short_window], [long_window])
+    return opening[0, 0], closing[0, 0]
@@ -1,18 +1,29 @@
 from config import *
 from dotenv import load_dotenv
 import os
+import gzip
+import json
 from helper_functions import binance_ohlc_api_getter
-from binance.client import Client
 import boto3
+from botocore.config import Config
+
+def upload_klines(s3_client, bucket_name, symbol, klines):
+    '''compact gzipped json, read back by binance_db_updater'''
+    s3_key = f'{symbol}.json.gz'
+    body = gzip.compress(json.dumps(klines, separators=(',', ':')).encode())
+    s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=body, ContentType='application/gzip')
+    return s3_key
 
 def lambda_handler(event, context):
+    '''one symbol: {"symbol": "BTC", ...}
+       batch mode: {"symbols": ["BTC", "ETH", ...], ...}, e.g. the binance_ticker_generator output as is'''
     try:
         # Validate required event parameters
-        required_params = ['start_date', 'end_date', 'interval', 'symbol']
-        if not all(param in event for param in required_params):
+        required_params = ['start_date', 'end_date', 'interval']
+        if not all(param in event for param in required_params) or not ('symbol' in event or 'symbols' in event):
             return {
                 'statusCode': 400,
-                'body': f'Missing required parameters. Required: {required_params}'
+                'body': f'Missing required parameters. Required: {required_params} and symbol or symbols'
             }
 
         # Load environment variables and initialize clients
@@ -25,51 +36,56 @@ def lambda_handler(event, context):
                 'body': 'Missing required environment variables'
             }
 
-        s3_client = boto3.client('s3')
-        bucket_name = "lambda-use-zoyu"
+        s3_client = boto3.client('s3',
+                                 endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+                                 config=Config(max_pool_connections=BN_DOWNLOAD_WORKERS))
+        bucket_name = os.getenv('S3_BUCKET', S3_BUCKET)
         
         # Extract parameters from event
-        symbol = event['symbol']
+        symbols = event['symbols'] if 'symbols' in event else [event['symbol']]
         start_date = event['start_date']
         end_date = event['end_date']
         interval = event['interval']
-        json_save_path = '/tmp'
 
-        # Initialize API getter and download data
+        # Initialize API getter, each symbol is uploaded as soon as it is downloaded
         api_getter = binance_ohlc_api_getter(
             api_key=bn_api_key,
             api_secret=bn_api_secret, 
-            data_save_path=json_save_path,
+            data_save_path=None,
             interval=interval,
             start_date=start_date,
             end_date=end_date
         )
-        
-        download_result = api_getter._download_single_symbol(symbol)
-        if download_result == -1:
+        statuses = api_getter.download_symbols(
+            symbols, on_downloaded=lambda symbol, klines: upload_klines(s3_client, bucket_name, symbol, klines))
+        for status in statuses.values():
+            status['key'] = status.pop('result', None)
+
+        if 'symbols' in event:
+            failed = [symbol for symbol, status in statuses.items() if status['status'] == 'failed']
             return {
-                'statusCode': 500,
-                'body': f'Failed to download data for symbol {symbol}'
+                'statusCode': 200 if not failed else 207,
+                'body': {
+                    'message': f'Downloaded and uploaded {len(symbols) - len(failed)} of {len(symbols)} symbols',
+                    'bucket': bucket_name,
+                    'failed': failed,
+                    'symbols': statuses
+                }
             }
 
-        # Upload to S3
-        s3_file_path = f'{json_save_path}/{interval.split("_")[-1]}/{symbol}USDT.json'
-        s3_key = f'{symbol}.json'
-        try:
-            s3_client.upload_file(s3_file_path, bucket_name, s3_key)
-        except Exception as e:
+        symbol = event['symbol']
+        if statuses[symbol]['status'] == 'failed':
             return {
                 'statusCode': 500,
-                'body': f'Failed to upload to S3: {str(e)}'
+                'body': f'Failed to download data for symbol {symbol}: {statuses[symbol]["error"]}'
             }
-
         return {
             'statusCode': 200,
             'body': {
                 'message': 'Successfully downloaded and uploaded data',
                 'symbol': symbol,
                 'bucket': bucket_name,
-                'key': s3_key
+                'key': statuses[symbol]['key']
             }
         }
 
@@ -113,4 +129,15 @@ if __name__ == "__main__":
     }
     result_3 = lambda_handler(test_event_3, None)
     print("\nTest 3 - Invalid symbol:")
-    print(result_3)
\ No newline at end of file
+    print(result_3)
+
+    # Test case 4: Batch mode
+    test_event_4 = {
+        "start_date": "2024-01-01",
+        "end_date": "2024-04-01",
+        "interval": "1d",
+        "symbols": ["BTC", "ETH", "INVALID"]
+    }
+    result_4 = lambda_handler(test_event_4, None)
+    print("\nTest 4 - Batch mode:")
+    print(result_4)
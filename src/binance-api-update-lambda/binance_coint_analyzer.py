@@ -1,167 +1,288 @@
 from config import *
 from dotenv import load_dotenv
 import os
+import time
+import multiprocessing
+from multiprocessing.connection import wait
 from db_helper_functions import db_refresher, binance_cointegration_db_refresher
 import pandas as pd
+import numpy as np
 from statsmodels.tsa.stattools import coint
 import logging
-def lambda_handler(event, context):
-    # environment variables and initialize clients
-    load_dotenv(override=True)  
-    DB_NAME = os.getenv('DB_NAME')
-    DB_HOST = os.getenv('DB_HOST')
-    DB_USERNAME = os.getenv('DB_USERNAME')
-    DB_PASSWORD = os.getenv('DB_PASSWORD')
-    
 
-    group1_symbols = event.get('group1_symbols', ["BTC", "ETH", "SOL", "DOGE", "PEPE", "XRP", "BNB", "SHIB",
+'''
+Rolling cointegration of group1 x group2 pairs -> binance_analyzer_cointegration
+  pairs run on one worker process per vCPU, finished pairs are flushed to the db every COINT_FLUSH_PAIRS pairs.
+  when the Lambda is about to run out of time no new pairs are started and the response carries a continuation:
+    {'statusCode': 200, 'body': {..., 'continuation': {<event for the next invocation, with the remaining 'pairs'>}}}
+  a step function loops on body.continuation until it is null.
+'''
+
+GROUP1_SYMBOLS = ["BTC", "ETH", "SOL", "DOGE", "PEPE", "XRP", "BNB", "SHIB",
     "AVAX", "SUI", "ADA", "NEAR", "FLOKI", "LINK", "FET",
-    "SEI", "OP", "FIL", "FTM", "LTC", "PEOPLE", "INJ", "DOT", "TRX", "APT"]) 
-    
-    group2_symbols = event.get('group2_symbols', [
+    "SEI", "OP", "FIL", "FTM", "LTC", "PEOPLE", "INJ", "DOT", "TRX", "APT"]
+
+GROUP2_SYMBOLS = [
     "BTC", "ETH", "SOL", "DOGE", "PEPE", "XRP", "BNB", "SHIB",
     "AVAX", "SUI", "ARB", "ADA", "WLD", "NEAR", "FLOKI", "RUNE", "LINK", "FET",
     "SEI", "OP", "FIL", "FTM", "LTC", "PEOPLE", "INJ", "DOT", "TRX", "APT",
     "BCH", "GALA", "ICP", "UNI", "TRB", "ETC", "STX", "LUNC",
     "ENS", "XLM", "ARKM", "HBAR", "ATOM", "PENDLE", "DYDX", "AAVE", "JASMY", "LDO",
     "FTT", "AR", "CRV", "CKB", "LUNA", "OM"
-]) 
-    
-    # group1_symbols = event.get('group1_symbols', ["BTC", "ETH", "SOL"]) 
-    
-    # group2_symbols = event.get('group2_symbols', ["BTC", "ETH", "SOL", "DOGE", "PEPE", "XRP"]) 
-    
-    window_size = event.get('window_size', 60)
-    
-    # get market data from db
-    db = db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "binance_market_data")
-    db.connect()
-    market_data = db.get_data(columns=["date", "symbol", "close"])
-    db.close()
-    
-    def _single_pair_rolling_coint(data1, data2, window_size):
-        '''
-        Calculate rolling cointegration between two time series
-        '''
-        rolling_p_values = []
-        for end in range(window_size, len(data1)):
-            start = end - window_size
-            series1 = data1[start:end]
-            series2 = data2[start:end]
-            
-            # Check for NaN values in the window
-            if series1.isna().any() or series2.isna().any():
-                rolling_p_values.append(-1)
-            else:
-                _, p_value, _ = coint(series1, series2, trend='ct')
-                rolling_p_values.append(p_value)
-
-        return rolling_p_values
-
-    def calculate_group_cointegration(
-        market_data_pivot: pd.DataFrame, 
-        group1_symbols: list[str] = None, 
-        group2_symbols: list[str] = None, 
-        window_size: int = 60
-    ) -> pd.DataFrame:
-        """
-        Calculate cointegration between two groups of symbols
-        """
-        # If groups not specified, use all symbols for both groups
-        if group1_symbols is None:
-            group1_symbols = market_data_pivot.columns.tolist()
-        if group2_symbols is None:
-            group2_symbols = market_data_pivot.columns.tolist()
-        
-        # Validate symbols exist in data
-        missing_symbols = [sym for sym in group1_symbols + group2_symbols 
-                            if sym not in market_data_pivot.columns]
-        if missing_symbols:
-            raise ValueError(f"Symbols not found in data: {missing_symbols}")
-            
-        # get date that needed updates
-        db = db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "binance_analyzer_cointegration")
-        db.connect()
-        existing_coint_data = db.get_data(columns=["symbol_one", "symbol_two", "date", "window_size"])
-        if existing_coint_data is None:
-            existing_coint_data = pd.DataFrame(columns=["symbol_one", "symbol_two", "date", "window_size", "coint_p_value"])
-        db.close()
-        
-        results = []
-        processed_pairs = set()
-        for sym1 in group1_symbols:
-            for sym2 in group2_symbols:
-                # Skip if same symbol or if pair already processed
-                if sym1 == sym2:
-                    continue
-                    
-                pair = tuple(sorted([sym1, sym2]))
-                if pair in processed_pairs:
+]
+
+def _single_pair_rolling_coint(data1, data2, window_size):
+    '''
+    Calculate rolling cointegration between two time series
+    '''
+    rolling_p_values = []
+    for end in range(window_size, len(data1)):
+        start = end - window_size
+        series1 = data1[start:end]
+        series2 = data2[start:end]
+
+        # Check for NaN values in the window
+        if series1.isna().any() or series2.isna().any():
+            rolling_p_values.append(-1)
+        else:
+            _, p_value, _ = coint(series1, series2, trend='ct')
+            rolling_p_values.append(p_value)
+
+    return rolling_p_values
+
+def group_pairs(group1_symbols, group2_symbols):
+    '''unique unordered pairs of group1 x group2, as [sym1, sym2] in group order'''
+    pairs = []
+    processed_pairs = set()
+    for sym1 in group1_symbols:
+        for sym2 in group2_symbols:
+            # Skip if same symbol or if pair already processed
+            if sym1 == sym2:
+                continue
+            pair = tuple(sorted([sym1, sym2]))
+            if pair in processed_pairs:
+                continue
+            processed_pairs.add(pair)
+            pairs.append([sym1, sym2])
+    return pairs
+
+def pair_rolling_coint(market_data_pivot, sym1, sym2, window_size, latest_date=None):
+    '''result rows of one pair. the p value of a date is from the window_size rows before it; with latest_date
+       (the pair's latest stored date) only the windows ending after it are computed, located by row position'''
+    data1 = market_data_pivot[sym1]
+    data2 = market_data_pivot[sym2]
+    if latest_date is not None:
+        latest_date = pd.to_datetime(latest_date).date()
+        # first row newer than the stored max, its window starts window_size rows earlier
+        first_new = data1.index.searchsorted(latest_date, side='right')
+        start = max(first_new - window_size, 0)
+        data1 = data1.iloc[start:]
+        data2 = data2.iloc[start:]
+        logging.info(f"Updating existing pair {sym1}-{sym2}: {len(data1) - window_size} new dates after {latest_date}")
+    else:
+        # For new pairs, use all available data
+        logging.info(f"Processing new pair {sym1}-{sym2} for all available dates")
+
+    p_values = _single_pair_rolling_coint(
+        data1,
+        data2,
+        window_size
+    )
+
+    results = []
+    dates = data1.index[window_size:]
+    for date, p_value in zip(dates, p_values):
+        results.append({
+            'symbol1': sym1,
+            'symbol2': sym2,
+            'date': date,
+            'window_size': window_size,
+            'p_value': p_value
+        })
+    return results
+
+def check_incremental_matches_full(n_dates=150, window_size=30):
+    '''extending a pair from a stored max date must give exactly the rows a full recompute has after that date'''
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2024-01-01', periods=n_dates).date # gaps, calendar days != rows
+    market_data_pivot = pd.DataFrame(100 + rng.normal(size=(n_dates, 2)).cumsum(axis=0), index=dates, columns=['A', 'B'])
+    market_data_pivot.iloc[n_dates // 2, 1] = np.nan
+    full = pd.DataFrame(pair_rolling_coint(market_data_pivot, 'A', 'B', window_size))
+    for latest_date in [dates[0], dates[window_size - 1], dates[window_size], dates[n_dates // 2], dates[-2], dates[-1]]:
+        incremental = pd.DataFrame(pair_rolling_coint(market_data_pivot, 'A', 'B', window_size, latest_date),
+                                   columns=full.columns)
+        expected = full[full['date'] > latest_date].reset_index(drop=True)
+        pd.testing.assert_frame_equal(incremental, expected, check_dtype=False)
+    print("incremental pair extension matches the full recompute")
+
+def _pair_worker(conn, market_data_pivot, window_size, latest_dates):
+    # receives [sym1, sym2] until None, answers (pair, rows, error)
+    while True:
+        pair = conn.recv()
+        if pair is None:
+            break
+        sym1, sym2 = pair
+        try:
+            rows = pair_rolling_coint(market_data_pivot, sym1, sym2, window_size, latest_dates.get((sym1, sym2, window_size)))
+            conn.send((pair, rows, None))
+        except Exception as e:
+            conn.send((pair, None, f"{type(e).__name__}: {e}"))
+    conn.close()
+
+def run_pairs(market_data_pivot, pairs, window_size, latest_dates, on_results, remaining_ms=None, max_workers=None):
+    '''
+    Fan the pairs out over worker processes, one per vCPU. Lambda has no /dev/shm so multiprocessing.Pool / Queue
+    are unavailable, every worker gets its own Pipe instead. The (forked) workers share market_data_pivot.
+    on_results(pair, rows) runs in this process as pairs finish.
+    remaining_ms() (context.get_remaining_time_in_millis) stops new pairs once less than COINT_TIME_MARGIN_MS plus
+    the slowest pair so far is left; pairs still running COINT_FLUSH_MARGIN_MS before the deadline are abandoned.
+    Returns (pairs not done, failed pairs)
+    '''
+    todo = [list(pair) for pair in pairs]
+    failed = []
+    if not todo:
+        return todo, failed
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(todo))
+    mp_context = multiprocessing.get_context('fork')
+    workers = {} # parent end of the pipe -> [process, pair running or None, started]
+    for _ in range(max_workers):
+        parent_conn, child_conn = mp_context.Pipe()
+        process = mp_context.Process(target=_pair_worker, args=(child_conn, market_data_pivot, window_size, latest_dates), daemon=True)
+        process.start()
+        child_conn.close()
+        workers[parent_conn] = [process, None, None]
+    logging.info(f"Running {len(todo)} pairs on {max_workers} processes")
+
+    slowest = 0.0
+    def dispatch(conn):
+        out_of_time = remaining_ms is not None and remaining_ms() < COINT_TIME_MARGIN_MS + slowest * 1000
+        if todo and not out_of_time:
+            workers[conn][1:] = [todo.pop(0), time.perf_counter()]
+            conn.send(workers[conn][1])
+        else:
+            workers[conn][1:] = [None, None]
+
+    try:
+        for conn in workers:
+            dispatch(conn)
+        while True:
+            busy = [conn for conn, worker in workers.items() if worker[1] is not None]
+            if not busy:
+                break
+            timeout = None if remaining_ms is None else max(0, (remaining_ms() - COINT_FLUSH_MARGIN_MS) / 1000)
+            ready = wait(busy, timeout=timeout)
+            if not ready:
+                # deadline: hand the running pairs back to the continuation
+                for conn in busy:
+                    todo.insert(0, workers[conn][1])
+                    workers[conn][1] = None
+                logging.warning(f"Out of time, abandoned {len(busy)} running pairs")
+                break
+            for conn in ready:
+                try:
+                    pair, rows, error = conn.recv()
+                except EOFError:
+                    # worker died (e.g. out of memory), its pair is not retried
+                    failed.append(workers[conn][1])
+                    logging.error(f"Worker processing {workers[conn][1]} died")
+                    workers[conn][1] = None
                     continue
-                processed_pairs.add(pair)
-                
-                logging.info(f"Processing cointegration for pair: {sym1}-{sym2}")
-                
-                # Get latest date for this symbol pair
-                pair_data = existing_coint_data[
-                    (existing_coint_data['symbol_one'] == sym1) & 
-                    (existing_coint_data['symbol_two'] == sym2)
-                ]
-                
-                # If pair exists in database, only calculate from latest date - window_size
-                # If pair doesn't exist, calculate for all dates
-                if len(pair_data) > 0:
-                    latest_date = pd.to_datetime(pair_data['date'].max())
-                    start_date = latest_date - pd.Timedelta(days=window_size) 
-                    data1 = market_data_pivot[sym1][market_data_pivot.index >= start_date.date()]
-                    data2 = market_data_pivot[sym2][market_data_pivot.index >= start_date.date()]
-                    logging.info(f"Updating existing pair {sym1}-{sym2} from {latest_date}")
+                slowest = max(slowest, time.perf_counter() - workers[conn][2])
+                if error:
+                    failed.append(pair)
+                    logging.error(f"Failed pair {pair}: {error}")
                 else:
-                    # For new pairs, use all available data
-                    data1 = market_data_pivot[sym1]
-                    data2 = market_data_pivot[sym2]
-                    logging.info(f"Processing new pair {sym1}-{sym2} for all available dates")
-                
-                p_values = _single_pair_rolling_coint(
-                    data1,
-                    data2,
-                    window_size
-                )
-                
-                dates = data1.index[window_size:]
-                for date, p_value in zip(dates, p_values):
-                    # For existing pairs, only add new dates
-                    # For new pairs, add all dates
-                    if len(pair_data) == 0 or date > latest_date.date():
-                        results.append({
-                            'symbol1': sym1,
-                            'symbol2': sym2,
-                            'date': date,
-                            'window_size': window_size,
-                            'p_value': p_value
-                        })
-                
-                logging.info(f"Completed processing pair {sym1}-{sym2}")
-        
-        if not results:
-            return pd.DataFrame()
-            
-        results_df = pd.DataFrame(results)
-        results_df['date'] = pd.to_datetime(results_df['date'])
-        return results_df
+                    on_results(pair, rows)
+                    logging.info(f"Completed processing pair {pair[0]}-{pair[1]}")
+                dispatch(conn)
+    finally:
+        for conn, (process, _, _) in workers.items():
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+    return todo, failed
+
+def lambda_handler(event, context):
+    # environment variables and initialize clients
+    load_dotenv(override=True)
+    DB_NAME = os.getenv('DB_NAME')
+    DB_HOST = os.getenv('DB_HOST')
+    DB_USERNAME = os.getenv('DB_USERNAME')
+    DB_PASSWORD = os.getenv('DB_PASSWORD')
+
+    group1_symbols = event.get('group1_symbols', GROUP1_SYMBOLS)
+    group2_symbols = event.get('group2_symbols', GROUP2_SYMBOLS)
+    window_size = event.get('window_size', 60)
+    remaining_ms = getattr(context, 'get_remaining_time_in_millis', None)
+
+    # get market data from db
+    with db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "binance_market_data") as db:
+        market_data = db.get_data(columns=["date", "symbol", "close"])
+
     # Prepare market data transformation
     market_data_pivot = market_data.pivot(index='date', columns='symbol', values='close')
     market_data_pivot = market_data_pivot.sort_index()
-    
-    # run
-    results_df = calculate_group_cointegration(market_data_pivot, group1_symbols=group1_symbols, group2_symbols=group2_symbols, window_size=window_size)
-    
-    # update
-    db = binance_cointegration_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "binance_analyzer_cointegration")
-    db.connect()
-    db.create_table()
-    db.insert_data(results_df)
-    
-    
+
+    # a continuation carries the pairs left by the previous invocation
+    pairs = event.get('pairs', group_pairs(group1_symbols, group2_symbols))
+
+    # Validate symbols exist in data
+    missing_symbols = sorted({sym for pair in pairs for sym in pair if sym not in market_data_pivot.columns})
+    if missing_symbols:
+        raise ValueError(f"Symbols not found in data: {missing_symbols}")
+
+    with binance_cointegration_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "binance_analyzer_cointegration") as db:
+        db.create_table()
+        # get date that needed updates
+        latest_dates = db.get_max_dates(["symbol_one", "symbol_two", "window_size"])
+
+        # finished pairs are written in batches so a timeout loses at most one batch.
+        # a batch the db rejects (insert_data returns 0) reports its pairs as failed instead of done
+        buffer = {'pairs': [], 'rows': [], 'inserted': 0, 'failed': []}
+        def flush():
+            if buffer['rows']:
+                inserted = db.insert_data(pd.DataFrame(buffer['rows']))
+                if inserted:
+                    buffer['inserted'] += inserted
+                else:
+                    buffer['failed'].extend(buffer['pairs'])
+                    logging.error(f"Failed to write a batch of {len(buffer['pairs'])} pairs")
+            buffer['pairs'], buffer['rows'] = [], []
+        def on_results(pair, rows):
+            buffer['pairs'].append(list(pair))
+            buffer['rows'].extend(rows)
+            if len(buffer['pairs']) >= COINT_FLUSH_PAIRS:
+                flush()
+
+        remaining_pairs, failed_pairs = run_pairs(market_data_pivot, pairs, window_size, latest_dates, on_results,
+                                                  remaining_ms=remaining_ms, max_workers=event.get('max_workers'))
+        flush()
+        failed_pairs += buffer['failed']
+
+    continuation = None
+    if remaining_pairs:
+        continuation = {'group1_symbols': group1_symbols, 'group2_symbols': group2_symbols,
+                        'window_size': window_size, 'pairs': remaining_pairs}
+    return {
+        'statusCode': 200,
+        'body': {
+            'pairs_done': len(pairs) - len(remaining_pairs) - len(failed_pairs),
+            'rows': buffer['inserted'],
+            'failed_pairs': failed_pairs,
+            'continuation': continuation
+        }
+    }
+
+
 if __name__ == "__main__":
-    lambda_handler({}, {})
+    import sys
+    if '--check' in sys.argv:
+        check_incremental_matches_full()
+    else:
+        print(lambda_handler({}, {}))
@@ -1,49 +1,102 @@
 from config import *
 from dotenv import load_dotenv
 import os
+import gzip
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from db_helper_functions import binance_OHLC_db_refresher
 import boto3
-import tempfile
+from botocore.config import Config
+
+'''
+S3 -> binance_market_data
+  every {symbol}.json / {symbol}.json.gz object in the bucket is fetched on a thread pool, parsed in memory and
+  upserted in one batch (one commit).
+  local run against a minio / moto server and a local postgres:
+    S3_ENDPOINT_URL=http://localhost:9000 S3_BUCKET=test-bucket DB_HOST=localhost ... python binance_db_updater.py
+'''
+
+JSON_SUFFIXES = ('.json', '.json.gz')
+
+def get_s3_client(max_workers=S3_DOWNLOAD_WORKERS):
+    # boto3 clients are thread safe, the connection pool has to be as large as the thread pool
+    return boto3.client('s3',
+                        endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+                        config=Config(max_pool_connections=max_workers, retries={'max_attempts': 5, 'mode': 'standard'}))
+
+def list_json_keys(s3_client, bucket_name, prefix=S3_PREFIX):
+    '''every json key in the bucket, list_objects_v2 alone stops at 1000'''
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith(JSON_SUFFIXES):
+                yield obj['Key']
+
+def symbol_from_key(key):
+    name = os.path.basename(key)
+    return name[:-len('.json.gz')] if name.endswith('.json.gz') else name[:-len('.json')]
+
+def fetch_rows(s3_client, bucket_name, key, db):
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+    if key.endswith('.gz'):
+        body = gzip.decompress(body)
+    return db.parse_klines(json.loads(body), symbol_from_key(key))
 
 def lambda_handler(event, context):
         try:
             # Load environment variables and initialize clients
-            load_dotenv(override=True)  
+            load_dotenv(override=True)
             DB_NAME = os.getenv('DB_NAME')
             DB_HOST = os.getenv('DB_HOST')
             DB_USERNAME = os.getenv('DB_USERNAME')
             DB_PASSWORD = os.getenv('DB_PASSWORD')
-            
-            s3_client = boto3.client('s3')
-            bucket_name = "lambda-use-zoyu"
-            
-            # Create temp directory to store downloaded files
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # List all JSON files in the S3 bucket
-                response = s3_client.list_objects_v2(Bucket=bucket_name)
-           
-                # Connect to database
-                db = binance_OHLC_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "binance_market_data")
-                db.connect()
+
+            s3_client = get_s3_client()
+            bucket_name = os.getenv('S3_BUCKET', S3_BUCKET)
+            start = time.perf_counter()
+
+            with binance_OHLC_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "binance_market_data") as db:
                 db.create_table()
-                
-                # Download and process each file
-                for obj in response.get('Contents', []):
-                    if obj['Key'].endswith('.json'):
-                        # Download file from S3
-                        temp_file_path = os.path.join(temp_dir, obj['Key'])
-                        s3_client.download_file(bucket_name, obj['Key'], temp_file_path)
-                        
-                        # Insert data into database
-                        db.insert_data(temp_file_path)
-                
-                db.close()
-                
+
+                # rows keyed by the primary key: one upsert cannot touch the same row twice
+                rows = {}
+                failed_keys = []
+                listed = set(list_json_keys(s3_client, bucket_name))
+                # a symbol re-uploaded by the batch getter leaves its old uncompressed object behind
+                keys = sorted(key for key in listed if not (key.endswith('.json') and key + '.gz' in listed))
+                with ThreadPoolExecutor(max_workers=S3_DOWNLOAD_WORKERS) as executor:
+                    futures = {executor.submit(fetch_rows, s3_client, bucket_name, key, db): key for key in keys}
+                    for future in as_completed(futures):
+                        try:
+                            key_rows = future.result()
+                        except Exception as e:
+                            key_rows = None
+                            logging.error(f"Failed to fetch {futures[future]}: {e}")
+                        if key_rows is None:
+                            failed_keys.append(futures[future])
+                            continue
+                        for row in key_rows:
+                            rows[(row[0], row[1])] = row
+                fetch_seconds = time.perf_counter() - start
+
+                inserted = db.insert_rows(list(rows.values())) if rows else 0
+                if rows and not inserted:
+                    raise RuntimeError(f"Batch upsert of {len(rows)} rows failed")
+
+            logging.info(f"{len(keys)} objects ({len(failed_keys)} failed) fetched in {fetch_seconds:.1f}s, "
+                         f"{inserted} rows upserted in {time.perf_counter() - start - fetch_seconds:.1f}s")
             return {
                 'statusCode': 200,
-                'body': 'Successfully updated database'
+                'body': {
+                    'message': 'Successfully updated database',
+                    'objects': len(keys),
+                    'rows': inserted,
+                    'failed_keys': failed_keys
+                }
             }
-            
+
         except Exception as e:
             return {
                 'statusCode': 500,
@@ -51,4 +104,4 @@ def lambda_handler(event, context):
             }
 
 if __name__ == "__main__":
-    lambda_handler(None, None)
+    print(lambda_handler(None, None))
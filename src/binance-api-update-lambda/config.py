@@ -12,6 +12,10 @@ BN_CHECKPOINT_FILE = CHECKPOINT_JSON_PATH + '/binance_checkpoint.json'
 BN_JSON_PATH = DATA_FOLDER + '/binance_raw_json'
 BN_DAILY_JSON_PATH = BN_JSON_PATH + '/1d'
 BN_HOURLY_JSON_PATH = BN_JSON_PATH + '/1h'
+BN_WEIGHT_PER_MINUTE = 4800 # binance allows 6000 per IP per minute, leave headroom for other callers
+BN_KLINES_WEIGHT = 2
+BN_KLINES_LIMIT = 1000
+BN_DOWNLOAD_WORKERS = 8
 
 # COIN GECKO JSON
 DAYS_PER_API_LIMIT = 180
@@ -52,6 +56,10 @@ STOCK_COINT_RESULT_CSV = COINT_CSV_PATH + '/stocks_rolling_coint_result.csv'
 ROLLING_COINT_COIN_CHECKPOINT_FILE = CHECKPOINT_JSON_PATH + '/rolling_coint_coins_checkpoint.json'
 COIN_COINT_RESULT_CSV = COINT_CSV_PATH + '/coins_rolling_coint_result.csv'
 
+# DB CONNECTION POOL
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 4
+DB_STATEMENT_TIMEOUT_MS = 0 # 0 disables the timeout
 
 '''PARAMETERS'''
 #ROLLING COINT CSV CALCULATION#
@@ -64,3 +72,13 @@ ROLLING_COINT_WINDOW = 60
 HIST_WINDOW_SIG_EVAL = 240
 RECENT_WINDOW_SIG_EVAL = 60 
 OLS_WINDOW = 60
+
+# S3 (S3_BUCKET / S3_ENDPOINT_URL env vars override, e.g. a local minio or moto server)
+S3_BUCKET = 'lambda-use-zoyu'
+S3_PREFIX = ''
+S3_DOWNLOAD_WORKERS = 16
+
+# BINANCE COINT ANALYZER
+COINT_FLUSH_PAIRS = 50 # finished pairs written per batch
+COINT_TIME_MARGIN_MS = 60000 # no new pairs once less than this (+ the slowest pair) is left of the invocation
+COINT_FLUSH_MARGIN_MS = 20000 # pairs still running this close to the deadline go back into the continuation
@@ -1,11 +1,20 @@
 from abc import ABC, abstractmethod
 import os
+import io
 import json
+import time
 import pandas as pd
 import psycopg2
 from psycopg2 import OperationalError
 from psycopg2.extras import execute_values
 from config import *
+try:
+    from db_pool import db_pool # copied next to this file by lambda-build.sh
+except ImportError:
+    # local runs use the one shared module, src/utils/db_pool.py
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'utils'))
+    from db_pool import db_pool
 import logging
 from datetime import datetime
 
@@ -73,12 +82,10 @@ class db_refresher(ABC):
         self.data_insertion_script = None  # This will be set in child classes
          
     def connect(self):
+        '''borrow a connection from the shared pool, see db_pool'''
         try:
-            self.conn = psycopg2.connect(
-                host=self.db_host,
-                database=self.db_name,
-                user=self.db_username,
-                password=self.db_password)
+            self.pool = db_pool.get(self.db_name, self.db_host, self.db_username, self.db_password)
+            self.conn = self.pool.checkout()
             print(f"Connected to {self.db_host} {self.db_name}!")
         except OperationalError as e:
             print(f"Error connecting to database: {e}")
@@ -86,8 +93,16 @@ class db_refresher(ABC):
 
     def close(self):
         if self.conn:
-            self.conn.close()
-            print("Database connection closed.")
+            self.pool.checkin(self.conn)
+            self.conn = None
+            print("Database connection returned to pool.")
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
       
     def create_table(self):
         cursor = self.conn.cursor()
@@ -129,6 +144,43 @@ class db_refresher(ABC):
         finally:
             cursor.close()
 
+    def insert_rows(self, rows, page_size=1000):
+        '''one upsert for rows gathered from many sources, committed once. returns the row count (0 on failure)'''
+        cursor = self.conn.cursor()
+        try:
+            execute_values(cursor, self.data_insertion_script, rows, page_size=page_size)
+            self.conn.commit()
+            logging.info(f"Inserted {len(rows)} rows into {self.table_name}")
+            return len(rows)
+        except Exception as e:
+            logging.error(f"Failed to insert {len(rows)} rows into {self.table_name}: {e}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
+
+    def get_max_dates(self, key_columns, date_column="date"):
+        """Latest date per key, computed by the database (GROUP BY) instead of loading every row
+
+        Args:
+            key_columns (list): Columns identifying a series, e.g. ["symbol_one", "symbol_two", "window_size"]
+            date_column (str): Column to take the MAX of
+
+        Returns:
+            dict: {tuple of key values: latest date}, empty when the table does not exist yet
+        """
+        cursor = self.conn.cursor()
+        try:
+            keys_str = ", ".join(key_columns)
+            cursor.execute(f"SELECT {keys_str}, MAX({date_column}) FROM {self.table_name} GROUP BY {keys_str}")
+            return {tuple(row[:-1]): row[-1] for row in cursor.fetchall()}
+        except Exception as e:
+            logging.error(f"Failed to retrieve latest dates: {str(e)}")
+            self.conn.rollback()
+            return {}
+        finally:
+            cursor.close()
+
     def get_data(self, columns=["*"], where_clause=None):
         """Retrieve data from the table
         
@@ -206,10 +258,14 @@ class binance_OHLC_db_refresher(db_refresher):
         """
         
     def _data_transformation(self, file_path):
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        symbol = os.path.splitext(os.path.basename(file_path))[0]
+        return self.parse_klines(data, symbol)
+
+    def parse_klines(self, data, symbol):
+        '''rows for one symbol from an already loaded binance klines list (file or S3 object body)'''
         try:
-            with open(file_path, 'r') as file:
-                data = json.load(file)
-            symbol = os.path.splitext(os.path.basename(file_path))[0]
             outputs = []
             seen_dates = set()
             
@@ -251,7 +307,7 @@ class binance_cointegration_db_refresher(db_refresher):
             date DATE NOT NULL,
             window_size INTEGER NOT NULL,
             coint_p_value DOUBLE PRECISION NOT NULL,
-            PRIMARY KEY (symbol_one, symbol_two, date)
+            PRIMARY KEY (symbol_one, symbol_two, window_size, date)
         );
         """
         
@@ -260,32 +316,94 @@ class binance_cointegration_db_refresher(db_refresher):
             symbol_one, symbol_two, date, window_size, coint_p_value
         )
         VALUES %s
-        ON CONFLICT (symbol_one, symbol_two, date)
+        ON CONFLICT (symbol_one, symbol_two, window_size, date)
         DO UPDATE SET
-            window_size = EXCLUDED.window_size,
             coint_p_value = EXCLUDED.coint_p_value;
         """
-        
+
+    def create_table(self):
+        '''create the table, or migrate a table keyed by (symbol_one, symbol_two, date): every window size is its
+           own series, so window_size joins the primary key (which also serves the get_max_dates GROUP BY)'''
+        super().create_table()
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+            SELECT c.conname, array_agg(a.attname::text)
+            FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY(c.conkey)
+            WHERE c.conrelid = to_regclass(%s) AND c.contype = 'p'
+            GROUP BY c.conname
+            """, (self.table_name,))
+            row = cursor.fetchone()
+            if row and 'window_size' not in row[1]:
+                cursor.execute(f"""
+                ALTER TABLE {self.table_name} DROP CONSTRAINT {row[0]},
+                    ADD PRIMARY KEY (symbol_one, symbol_two, window_size, date);
+                DROP INDEX IF EXISTS {self.table_name}_latest_idx;
+                """)
+                self.conn.commit()
+                logging.info(f"{self.table_name} primary key migrated to (symbol_one, symbol_two, window_size, date).")
+        except Exception as e:
+            logging.error(f"Failed to migrate {self.table_name} primary key: {str(e)}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
     def _data_transformation(self, pd_df):
+        '''analyzer result frame -> one row per (symbol_one, symbol_two, window_size, date), first occurrence wins'''
         try:
-            outputs = []
-            seen_pairs = set()
-            
-            for _, row in pd_df.iterrows():
-                symbol1 = row['symbol1']
-                symbol2 = row['symbol2']
-                date = pd.to_datetime(row['date']).strftime('%Y-%m-%d')
-                window_size = int(row['window_size'])
-                p_value = float(row['p_value'])
-                
-                pair_key = (symbol1, symbol2, date)
-                if pair_key not in seen_pairs:
-                    outputs.append([
-                        symbol1, symbol2, date, window_size, p_value
-                    ])
-                    seen_pairs.add(pair_key)
-                    
-            return outputs
+            df = pd.DataFrame({
+                'symbol_one': pd_df['symbol1'],
+                'symbol_two': pd_df['symbol2'],
+                'date': pd.to_datetime(pd_df['date']).dt.strftime('%Y-%m-%d'),
+                'window_size': pd_df['window_size'].astype(int),
+                'coint_p_value': pd_df['p_value'].astype(float),
+            })
+            return df.drop_duplicates(subset=['symbol_one', 'symbol_two', 'window_size', 'date'], keep='first')
+        except Exception as e:
+            logging.error(f"Data transformation failed: {e}")
+            return None
+
+    def insert_data(self, pd_df):
+        '''COPY the transformed rows into a temp staging table, then one upsert into the table and one commit.
+           returns the row count (0 on failure)'''
+        if pd_df is None or pd_df.empty:
+            logging.info(f"No rows to insert into {self.table_name}")
+            return 0
+        start = time.perf_counter()
+        df = self._data_transformation(pd_df)
+        if df is None:
+            return 0
+        transform_seconds = time.perf_counter() - start
+        logging.info(f"Transformed {len(pd_df)} rows into {len(df)} in {transform_seconds:.2f}s "
+                     f"({len(pd_df) / max(transform_seconds, 1e-9):,.0f} rows/s)")
+
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, na_rep='NaN')
+        buffer.seek(0)
+        columns = ', '.join(df.columns)
+        cursor = self.conn.cursor()
+        start = time.perf_counter()
+        try:
+            cursor.execute(f"""
+            CREATE TEMP TABLE {self.table_name}_staging (LIKE {self.table_name} INCLUDING DEFAULTS) ON COMMIT DROP;
+            """)
+            cursor.copy_expert(f"COPY {self.table_name}_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute(f"""
+            INSERT INTO {self.table_name} ({columns})
+            SELECT {columns} FROM {self.table_name}_staging
+            ON CONFLICT (symbol_one, symbol_two, window_size, date)
+            DO UPDATE SET
+                coint_p_value = EXCLUDED.coint_p_value;
+            """)
+            self.conn.commit()
+            insert_seconds = time.perf_counter() - start
+            logging.info(f"Inserted {len(df)} rows into {self.table_name} in {insert_seconds:.2f}s "
+                         f"({len(df) / max(insert_seconds, 1e-9):,.0f} rows/s)")
+            return len(df)
         except Exception as e:
-            logging.debug(f"Data transformation failed: {e}")
-            return None
\ No newline at end of file
+            logging.error(f"Failed to insert data into {self.table_name}: {e}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
@@ -7,7 +7,11 @@ from requests.exceptions import ConnectionError, Timeout, TooManyRedirects
 import requests
 import time
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from binance.client import Client
+from binance.exceptions import BinanceAPIException
+from binance.helpers import date_to_milliseconds
 
 logging.basicConfig(
     level=logging.INFO,
@@ -140,6 +144,32 @@ class coin_gecko_hourly_ohlc_api_getter(coin_gecko_daily_ohlc_api_getter):
         return all_data
 
 '''BINANCE'''
+class binance_weight_limiter:
+    '''binance limits request weight per IP per calendar minute (reported back as x-mbx-used-weight-1m).
+       threads acquire the weight of a request before sending it and wait for the next minute when it is spent'''
+    def __init__(self, weight_per_minute=BN_WEIGHT_PER_MINUTE):
+        self.weight_per_minute = weight_per_minute
+        self.lock = threading.Lock()
+        self.minute = None
+        self.used = 0
+
+    def acquire(self, weight):
+        while True:
+            with self.lock:
+                now = time.time()
+                if int(now // 60) != self.minute:
+                    self.minute, self.used = int(now // 60), 0
+                if self.used + weight <= self.weight_per_minute:
+                    self.used += weight
+                    return
+                wait = 60 - now % 60
+            time.sleep(wait)
+
+    def observe(self, used_weight):
+        '''sync with the weight binance reports, other clients on the same IP count too'''
+        with self.lock:
+            self.used = max(self.used, used_weight)
+
 class binance_ohlc_api_getter(coin_gecko_daily_ohlc_api_getter):
     '''Binance api data download that include volume data'''
     def __init__(self, api_key, api_secret, data_save_path, interval, start_date, end_date):
@@ -172,6 +202,60 @@ class binance_ohlc_api_getter(coin_gecko_daily_ohlc_api_getter):
         _, symbols = self._get_download_symbol_list()
         for symbol in symbols:
             self._download_single_symbol(symbol)
+
+    def _fetch_klines(self, symbol, limiter):
+        '''klines of one USDT pair in pages of BN_KLINES_LIMIT, every page goes through the weight limiter'''
+        start_ms = date_to_milliseconds(self.start_date)
+        end_ms = date_to_milliseconds(self.end_date)
+        klines = []
+        retries = 0
+        while start_ms <= end_ms:
+            limiter.acquire(BN_KLINES_WEIGHT)
+            try:
+                page = self.client.get_klines(symbol=symbol+'USDT', interval=self.interval,
+                                              startTime=start_ms, endTime=end_ms, limit=BN_KLINES_LIMIT)
+            except BinanceAPIException as e:
+                # 429: over the limit, 418: banned for ignoring 429s
+                if e.status_code not in (418, 429) or retries >= BN_MAX_RETRIES:
+                    raise
+                retries += 1
+                retry_after = int(e.response.headers.get('Retry-After', 60))
+                logging.warning(f"{symbol}: rate limited, retrying in {retry_after}s")
+                limiter.observe(limiter.weight_per_minute)
+                time.sleep(retry_after)
+                continue
+            response = getattr(self.client, 'response', None)
+            if response is not None and 'x-mbx-used-weight-1m' in response.headers:
+                limiter.observe(int(response.headers['x-mbx-used-weight-1m']))
+            klines.extend(page)
+            if len(page) < BN_KLINES_LIMIT:
+                break
+            start_ms = page[-1][0] + 1
+        return klines
+
+    def download_symbols(self, symbols, on_downloaded=None, max_workers=BN_DOWNLOAD_WORKERS, limiter=None):
+        '''downloads many symbols concurrently in one process under one weight limiter.
+           on_downloaded(symbol, klines) runs in the worker thread, its return value is kept in the status.
+           returns {symbol: {'status': 'succeeded', 'rows': n, 'result': ...} or {'status': 'failed', 'error': ...}}'''
+        limiter = limiter if limiter is not None else binance_weight_limiter()
+
+        def download(symbol):
+            klines = self._fetch_klines(symbol, limiter)
+            result = on_downloaded(symbol, klines) if on_downloaded else None
+            return {'status': 'succeeded', 'rows': len(klines), 'result': result}
+
+        statuses = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(download, symbol): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    statuses[symbol] = future.result()
+                    logging.info(f'Downloaded {symbol} ({statuses[symbol]["rows"]} klines)')
+                except Exception as e:
+                    logging.error(f"Error downloading {symbol}: {e}")
+                    statuses[symbol] = {'status': 'failed', 'error': str(e)}
+        return statuses
             
         
 '''ALPHA VANTAGE'''
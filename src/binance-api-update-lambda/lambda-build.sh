@@ -8,6 +8,10 @@ ECR_REGISTRY="${AWS_ACCOUNT_ID}.dkr.ecr.${AWS_REGION}.amazonaws.com"
 # Authenticate with ECR
 aws ecr get-login-password --region ${AWS_REGION} | docker login --username AWS --password-stdin ${ECR_REGISTRY}
 
+# db_pool.py is shared with the pipelines (src/utils/db_pool.py), copied into the build context for the images
+cp ../utils/db_pool.py db_pool.py
+trap 'rm -f db_pool.py' EXIT
+
 # Function to build and push image
 build_and_push() {
     local DOCKERFILE=$1
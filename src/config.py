@@ -1,5 +1,4 @@
 from datetime import datetime
-from twilio.rest import Client
 
 # DATA_FOLDER = '/home/ec2-user/financial_database/backend/data'
 # DATA_FOLDER = 'C:/Users/zongy/Desktop/repo/financial_database/backend/data'
@@ -9,6 +8,7 @@ RAW_CSV_PATH = DATA_FOLDER + '/raw_csv'
 CHECKPOINT_JSON_PATH = DATA_FOLDER + '/checkpoints'
 COINT_CSV_PATH = DATA_FOLDER + '/rolling_coint_result_csv'
 SIGNAL_CSV_PATH = DATA_FOLDER + '/signal_csv'
+RUN_REPORT_PATH = DATA_FOLDER + '/run_reports'
 
 # BINANCE JSON 
 TOP_N_COINS_DOWNLOADED_FROM_BINANCE = 200
@@ -57,12 +57,31 @@ STOCK_COINT_RESULT_CSV = COINT_CSV_PATH + '/stocks_rolling_coint_result.csv'
 ROLLING_COINT_COIN_CHECKPOINT_FILE = CHECKPOINT_JSON_PATH + '/rolling_coint_coins_checkpoint.json'
 COIN_COINT_RESULT_CSV = COINT_CSV_PATH + '/coins_rolling_coint_result.csv'
 
+# stonewell indicator state
+STONEWELL_STATE_FILE = CHECKPOINT_JSON_PATH + '/stonewell_indicator_state.json'
+STONEWELL_STATE_SETTLE_DAYS = 5 # bars this recent can still be restated by the daily download
+
+# btc relative metrics (price_in_btc, 140d SMA flags) for the cycle analytics in sql/
+BTC_METRICS_SETTLE_DAYS = 5 # recomputed on every refresh, the daily download can restate them
+
+# PIPELINE DAG: stages running at once, and threaded_file_loader threads a stage can run next to itself
+PIPELINE_MAX_WORKERS = 4
+PIPELINE_LOADER_THREADS = 1
+
+# DB CONNECTION POOL
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = PIPELINE_MAX_WORKERS + PIPELINE_LOADER_THREADS # one per running stage plus one per loader thread
+DB_STATEMENT_TIMEOUT_MS = 0 # 0 disables the timeout
 
 '''PARAMETERS'''
 #ROLLING COINT CSV CALCULATION#
 # parameters
 ROLLING_COINT_START_DATE = '2024-01-01'
 ROLLING_COINT_WINDOW = 60
+ROLLING_COINT_WINDOWS = [ROLLING_COINT_WINDOW] # computed in one pass per pair, e.g. [30, 60, 120, 240]
+COINT_SHARD_WORKERS = None # worker processes for sector shards, None -> one per core
+PAIRS_COINT_PARTITIONED = False # monthly date partitions + per-pair index for coin/stock_pairs_coint, migrates existing tables
+PAIRS_COINT_RETENTION_MONTHS = 24 # partitions older than this are dropped, None keeps everything
 
 #SIGNALS#
 # criteria
@@ -70,9 +89,30 @@ HIST_WINDOW_SIG_EVAL = 240
 RECENT_WINDOW_SIG_EVAL = 60 
 OLS_WINDOW = 60
 
+#PAIRS SPREAD# (replaces sql/AUTO_KEY_INSIGHTS.sql)
+SPREAD_LOOKBACK = 120 # latest price rows per symbol
+SPREAD_BB_WINDOW = 20
+SPREAD_BAND_SD = 1.8
+# key insights filter
+MIN_POTENTIAL_WIN_PCT = 0.01
+MIN_RECENT_COINT = 0.5
+MIN_R_SQUARED = 0.5
+
+#INDICATORS# utils.refactor_indicator_engine.calculate_indicators -> coin_indicators / stock_indicators
+INDICATOR_SMA_PERIODS = [20, 50, 200]
+INDICATOR_EMA_SPANS = [12, 26]
+INDICATOR_RSI_PERIOD = 14
+INDICATOR_BB_WINDOW = 20
+INDICATOR_BB_SD = 2
+INDICATOR_ATR_PERIOD = 14
+INDICATOR_WARMUP_DAYS = 600 # history loaded before the stored rows, EMA / Wilder seeds older than this weigh < 1e-12
+INDICATOR_SETTLE_DAYS = 5 # rewritten on every run, the daily download can restate them
+
 
 # send text notification
+# twilio is imported on use: every module does `from config import *`
 def outgoing_call(account_sid, auth_token, to_number):
+    from twilio.rest import Client
     client = Client(account_sid, auth_token)
     call = client.calls.create(
         url="http://demo.twilio.com/docs/voice.xml",
@@ -81,6 +121,7 @@ def outgoing_call(account_sid, auth_token, to_number):
     print(call.sid)
         
 def send_sms_message(account_sid, auth_token, to_number, message):
+    from twilio.rest import Client
     client = Client(account_sid, auth_token)
     message = client.messages.create(
             body=message,
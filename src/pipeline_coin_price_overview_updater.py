@@ -1,6 +1,7 @@
 from config import *
 from dotenv import load_dotenv
 import os
+import time
 from datetime import datetime, timedelta
 from utils.refactor_db_data_updater import *
 from utils.refactor_data_api_getter import *
@@ -16,10 +17,11 @@ DB_NAME = 'financial_data'
 Coin Price Refresh Pipeline
 Cadence: AUTOMATIC DAILY
   1. Download hist price json from coin gecko
-  2. Download overview data
-  3. Insert OHLC data into DB
-  4. Insert overview data into DB
+  2. Insert OHLC data into DB as each symbol's file lands (loader thread)
+  3. Insert overview data into DB as soon as the overview file is saved (second loader thread)
+  Each loader borrows its own pooled connection; wall time is reported per stage.
 '''
+pipeline_start = time.perf_counter()
 
 # download last 5 days data - partial update for faster runtime
 end_date = datetime.now() 
@@ -28,22 +30,20 @@ api_getter = coin_gecko_daily_ohlc_api_getter(api_key=gc_api_key,
                                               data_save_path=GECKO_DAILY_JSON_PATH, 
                                               start_date=start_date,
                                               end_date=end_date)
-api_getter.download_data()
 
-# insert to DB
-# OHLC
-db = coin_gecko_OHLC_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "coin_historical_price")
-db.connect()
-db.create_table()
-for filename in os.listdir(GECKO_DAILY_JSON_PATH):
-    if filename.endswith('.json'):
-        file_path = os.path.join(GECKO_DAILY_JSON_PATH, filename)
-        db.insert_data(file_path)
-db.close()
- 
-# insert coin overview from the overview file
-db = coin_gecko_overview_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "coin_overview")
-db.connect()
-db.create_table()
-db.insert_data(GECKO_JSON_PATH+'/mapping/top_symbol_by_mc.json')
-db.close()
\ No newline at end of file
+# insert to DB while downloading
+ohlc_loader = threaded_file_loader(coin_gecko_OHLC_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "coin_historical_price")).start()
+overview_loader = threaded_file_loader(coin_gecko_overview_db_refresher(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD, "coin_overview")).start()
+
+download_start = time.perf_counter()
+api_getter.download_data(on_downloaded=ohlc_loader.submit, on_overview=overview_loader.submit)
+download_seconds = time.perf_counter() - download_start
+
+ohlc_stats = ohlc_loader.finish()
+overview_stats = overview_loader.finish()
+
+logging.info(f"download: {download_seconds:.1f}s wall")
+for stats in (ohlc_stats, overview_stats):
+    logging.info(f"{stats['table']}: {stats['files']} files loaded, {stats['failed']} failed, "
+                 f"{stats['busy_seconds']:.1f}s inserting, {stats['wall_seconds']:.1f}s wall")
+logging.info(f"total: {time.perf_counter() - pipeline_start:.1f}s wall")
@@ -16,15 +16,27 @@ DB_NAME = 'financial_data'
  
 signal_csv_path = SIGNAL_CSV_PATH+'/stonewell_signal.csv'
 
+'''
+Stonewell Signal Refresh Pipeline
+Cadence: AUTOMATIC DAILY
+  1. Load saved indicator state, fetch only bars newer than it
+  2. Roll the state forward and take the latest indicators per symbol
+  3. Insert signal to DB, save state
+'''
+
 db = coin_stonewell_signal_updater(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
 db.connect()
-df = db.fetch_input_data(top_n_tickers=50)
+state = stonewell_signal_calculator.load_indicator_state(STONEWELL_STATE_FILE)
+top_tickers = db.fetch_top_tickers(top_n_tickers=50)
+df = db.fetch_input_data(top_n_tickers=50, last_dates=state.last_dates())
  
 calculator = stonewell_signal_calculator(df, signal_csv_path)
-output_df = calculator.calculate_data()
+output_df = calculator.calculate_latest_data(state, top_tickers)
+# full recompute: output_df = calculator.calculate_data() on fetch_input_data(top_n_tickers=50)
 signal_df = calculator.calculate_signal(output_df)
 
 db.insert_signal_data_table(signal_df)
+state.save()
 db.close()
 
 
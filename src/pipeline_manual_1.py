@@ -42,7 +42,7 @@ and date >= '2022-01-01'
 order by marketcapitalization desc
 """
 df = pd.read_sql(query, conn)
-conn.close()
+release_db(conn)
 
 price_df = df.pivot(index='date', columns='symbol', values='close')
 price_df.fillna(-1, inplace=True)
@@ -77,4 +77,4 @@ insert_stock_signal_table(conn, list(signal_df.itertuples(index=False, name=None
 
 # update api data after calculation
 update_stock_signal_final_api_data(conn)
-conn.close()
\ No newline at end of file
+release_db(conn)
\ No newline at end of file
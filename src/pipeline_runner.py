@@ -0,0 +1,144 @@
+from config import *
+from dotenv import load_dotenv
+import os
+import sys
+import warnings
+from datetime import datetime, timedelta
+from utils.pipeline_dag import pipeline_dag
+from utils.refactor_data_api_getter import *
+from utils.refactor_db_data_updater import *
+from utils.refactor_signal_calculator import *
+from utils.refactor_indicator_engine import calculate_indicators
+from utils.refactor_db_signal_updater import *
+
+warnings.filterwarnings("ignore", category=UserWarning, message="pandas only supports SQLAlchemy connectable")
+
+load_dotenv(override=True)
+gc_api_key = os.getenv('GECKO_API')
+DB_USERNAME = os.getenv('RDS_USERNAME')
+DB_PASSWORD = os.getenv('RDS_PASSWORD')
+DB_HOST = os.getenv('RDS_ENDPOINT')
+DB_NAME = 'financial_data'
+DB_CREDENTIALS = (DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
+
+'''
+Pipeline Runner
+Cadence: AUTOMATIC DAILY (replaces the pipeline_*.py chain in scripts/coin_price_update_script.sh)
+  python pipeline_runner.py coin_daily
+
+  coin_daily:
+    price_download ──> overview_load ──> stonewell_signal
+         ├──> btc_metrics
+         └──> indicators
+                            ├──> coint_signal ──> api_output
+                            │                 └──> spread_signal
+                            └──> hourly_price_download (rewrites the gecko ranking file overview_load reads)
+    cg_btc_metrics, alt_btc_metrics (no dependencies: *_btc_metrics of the cycle analytics source tables)
+
+  Stages run in one process, concurrently where the graph allows, on the shared db pool.
+  A run report with per-stage status, wall time and row counts is saved under RUN_REPORT_PATH.
+'''
+
+'''COIN DAILY STAGES'''
+def coin_price_download(context):
+    # last 5 days, OHLC files are loaded while the rest is still downloading
+    end_date = datetime.now()
+    api_getter = coin_gecko_daily_ohlc_api_getter(api_key=gc_api_key,
+                                                  data_save_path=GECKO_DAILY_JSON_PATH,
+                                                  start_date=end_date - timedelta(days=5),
+                                                  end_date=end_date)
+    loader = threaded_file_loader(coin_gecko_OHLC_db_refresher(*DB_CREDENTIALS, "coin_historical_price")).start()
+    api_getter.download_data(on_downloaded=loader.submit)
+    context['overview_file'] = api_getter.overview_save_path
+    return loader.finish()['rows']
+
+def btc_metrics_stage(source_table, btc_symbol):
+    # price_in_btc / 140d SMA flags of the new bars of source_table, read by the cycle analytics in sql/
+    def stage(context):
+        with btc_relative_metrics_db_refresher(*DB_CREDENTIALS, source_table, btc_symbol) as db:
+            db.create_table()
+            return db.refresh_metrics()
+    return stage
+
+def coin_indicators(context):
+    # SMA / EMA / RSI / Bollinger / ATR of every symbol's new bars -> coin_indicators
+    with coin_coint_db_signal_updater(*DB_CREDENTIALS) as db:
+        return db.insert_indicator_data(calculate_indicators(db.fetch_indicator_input_data()))
+
+def coin_hourly_price_download(context):
+    end_date = datetime.now()
+    api_getter = coin_gecko_hourly_ohlc_api_getter(api_key=gc_api_key,
+                                                   data_save_path=GECKO_HOURLY_JSON_PATH,
+                                                   start_date=end_date - timedelta(days=5),
+                                                   end_date=end_date)
+    downloaded = []
+    api_getter.download_data(on_downloaded=downloaded.append)
+    return len(downloaded)
+
+def coin_overview_load(context):
+    with coin_gecko_overview_db_refresher(*DB_CREDENTIALS, "coin_overview") as db:
+        db.create_table()
+        return db.insert_data(context['overview_file'])
+
+def coin_stonewell_signal(context):
+    with coin_stonewell_signal_updater(*DB_CREDENTIALS) as db:
+        state = stonewell_signal_calculator.load_indicator_state(STONEWELL_STATE_FILE)
+        top_tickers = db.fetch_top_tickers(top_n_tickers=50)
+        df = db.fetch_input_data(top_n_tickers=50, last_dates=state.last_dates())
+        calculator = stonewell_signal_calculator(df, SIGNAL_CSV_PATH+'/stonewell_signal.csv')
+        signal_df = calculator.calculate_signal(calculator.calculate_latest_data(state, top_tickers))
+        db.insert_signal_data_table(signal_df)
+        state.save()
+        return len(signal_df)
+
+def coin_coint_signal(context):
+    # the updater is kept in the context: it knows which signals changed for api_output
+    db = context['coin_coint_db'] = coin_coint_db_signal_updater(*DB_CREDENTIALS)
+    with db:
+        price_df = db.pivot_price_data(db.fetch_input_data(top_n_tickers=80))
+        coint_calc = coint_signal_calculator(price_df,
+                                             CHECKPOINT_JSON_PATH+'/coin_calc_pipeline.json',
+                                             COINT_CSV_PATH+'/coin_calc_pipeline_coint.csv',
+                                             SIGNAL_CSV_PATH+'/coin_calc_pipeline_signal.csv')
+        coint_df = coint_calc.calculate_data()
+        db.insert_output_data(coint_calc.transform_data(coint_df))
+        coint_df.columns = coint_df.columns.str.replace('_p_val$', '', regex=True)
+        signal_df = coint_calc.calculate_signal(coint_df)
+        db.insert_signal_data_table(signal_df)
+        return len(signal_df)
+
+def coin_spread_signal(context):
+    with coin_coint_db_signal_updater(*DB_CREDENTIALS) as db:
+        price_df, pair_signal_df = db.fetch_spread_input_data()
+        calculator = pairs_spread_signal_calculator(price_df, pair_signal_df, SIGNAL_CSV_PATH+'/coin_pairs_spread.csv')
+        return db.insert_spread_data(calculator.calculate_signal(calculator.calculate_data()))
+
+def coin_api_output(context):
+    with context['coin_coint_db'] as db:
+        return db.insert_api_output_data()
+
+def build_coin_daily_dag():
+    dag = pipeline_dag('coin_daily')
+    dag.add_stage('price_download', coin_price_download)
+    dag.add_stage('overview_load', coin_overview_load, depends_on=['price_download'])
+    dag.add_stage('btc_metrics', btc_metrics_stage('coin_historical_price', 'BTC'), depends_on=['price_download'])
+    # cg_coin_hist_price / alt_analysis_historical_price are loaded outside this runner, their refresh is a no-op
+    # until new bars arrive
+    dag.add_stage('cg_btc_metrics', btc_metrics_stage('cg_coin_hist_price', 'BTC'))
+    dag.add_stage('alt_btc_metrics', btc_metrics_stage('alt_analysis_historical_price', 'BTCUSDT'))
+    dag.add_stage('indicators', coin_indicators, depends_on=['price_download'])
+    dag.add_stage('hourly_price_download', coin_hourly_price_download, depends_on=['overview_load'])
+    dag.add_stage('stonewell_signal', coin_stonewell_signal, depends_on=['overview_load'])
+    dag.add_stage('coint_signal', coin_coint_signal, depends_on=['price_download', 'overview_load'])
+    dag.add_stage('api_output', coin_api_output, depends_on=['coint_signal'])
+    dag.add_stage('spread_signal', coin_spread_signal, depends_on=['coint_signal'])
+    return dag
+
+PIPELINES = {
+    'coin_daily': build_coin_daily_dag,
+}
+
+if __name__ == '__main__':
+    pipeline_name = sys.argv[1] if len(sys.argv) > 1 else 'coin_daily'
+    report = PIPELINES[pipeline_name]().run()
+    sys.exit(0 if report['succeeded'] else 1)
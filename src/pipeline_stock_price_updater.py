@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 import os
 from utils.refactor_db_data_updater import *
 from utils.refactor_data_api_getter import *
+from utils.refactor_db_signal_updater import stock_coint_db_signal_updater
+from utils.refactor_indicator_engine import calculate_indicators
 
 load_dotenv(override=True)
 bn_api_key = os.getenv('BINANCE_API')  
@@ -20,6 +22,7 @@ Stock Price Refresh Pipeline
 Cadence: AUTOMATIC DAILY
   1. Download stock price json from AVAN
   2. Insert data into DB
+  3. Refresh the stock_indicators table (read by sql/trend_base_strat_analysis.sql)
 '''
 # download json
 etfs = ["SPY",   # SPDR S&P 500 ETF - Large-Cap U.S. Stocks
@@ -96,4 +99,7 @@ for filename in os.listdir(AVAN_DAILY_JSON_PATH):
         file_path = os.path.join(AVAN_DAILY_JSON_PATH, filename)
         db.insert_data(file_path)
 db.close()
- 
\ No newline at end of file
+
+# indicators of the new bars
+with stock_coint_db_signal_updater(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD) as db:
+    db.insert_indicator_data(calculate_indicators(db.fetch_indicator_input_data()))
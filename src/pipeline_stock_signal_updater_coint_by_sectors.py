@@ -32,39 +32,28 @@ checkpoint_file_path = CHECKPOINT_JSON_PATH+'/calc_pipeline.json'
 coint_csv_path = COINT_CSV_PATH+'/calc_pipeline_coint_by_segment.csv'
 signal_csv_path = SIGNAL_CSV_PATH+'/calc_pipeline_signal_by_segment.csv'
 
-db = stock_coint_by_segment_db_signal_updater(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
-db.connect()
-df = db.fetch_input_data(top_n_tickers_by_sectors=50)
-price_df = db.pivot_price_data(df)
-
-all_results = pd.DataFrame()
-sector_groups = df.groupby('sector')
-for sector, group in sector_groups:
-    sector_price_df = db.pivot_price_data(group)
-    sector_coint_csv_path = f"{os.path.splitext(coint_csv_path)[0]}_{sector}.csv"
-    print(f'working on {sector} sector')
-    coint_calc = coint_signal_calculator(sector_price_df, checkpoint_file_path, sector_coint_csv_path, signal_csv_path)
-    sector_coint_df = coint_calc.calculate_data()
-    # join results
-    sector_coint_df.set_index('date', inplace=True)
-    all_results = pd.concat([all_results, sector_coint_df], axis=1, join='outer')
-
-# save all results
-all_results.reset_index(inplace=True)
-all_results.to_csv(coint_csv_path, index=False)
-
-# insert coint to db
-coint_df = pd.read_csv(coint_csv_path)
-
-# insert coint data
-db.insert_output_data(coint_calc.transform_data(coint_df))
-
-# calculate signal and insert signal
-coint_df.columns = coint_df.columns.str.replace('_p_val$', '', regex=True)
-signal_df = coint_calc.calculate_signal(coint_df)
-db.insert_signal_data_table(signal_df)
-
-# update api data after calculation
-db.insert_api_output_data()
-
-db.close()
\ No newline at end of file
+# workers are spawned on macOS, so the pipeline must only run from the main module
+if __name__ == '__main__':
+    db = stock_coint_by_segment_db_signal_updater(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
+    db.connect()
+    df = db.fetch_input_data(top_n_tickers_by_sectors=50)
+
+    # one shard per sector, each with its own checkpoint and csv (suffixed with the sector name)
+    sector_price_dfs = {sector: db.pivot_price_data(group) for sector, group in df.groupby('sector')}
+    coint_df, signal_df, failed_sectors = run_sharded_coint(sector_price_dfs, checkpoint_file_path, coint_csv_path,
+                                                            signal_csv_path, max_workers=COINT_SHARD_WORKERS)
+    if failed_sectors:
+        logging.error(f'Sectors failed and were not updated: {failed_sectors}')
+
+    # insert coint data
+    if not coint_df.empty:
+        db.insert_output_data(coint_df)
+
+    # insert signal
+    if not signal_df.empty:
+        db.insert_signal_data_table(signal_df)
+
+    # update api data after calculation
+    db.insert_api_output_data()
+
+    db.close()
@@ -0,0 +1,129 @@
+import atexit
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from psycopg2 import pool as pg_pool
+from config import *
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M' #datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+class db_pool:
+    '''one psycopg2 connection pool per (host, database, user), shared by every refresher / signal updater in the process
+       (the binance Lambda images get this file through lambda-build.sh, a pool is kept across warm invocations).
+       connections are borrowed and handed back instead of opened and closed, so a pipeline that connects several
+       times pays the RDS connect + TLS handshake once.
+            pool = db_pool.get(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD)
+            with pool.connection() as conn:
+                ...
+    '''
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, db_name, db_host, db_username, db_password,
+                 min_conn=DB_POOL_MIN_CONN, max_conn=DB_POOL_MAX_CONN, statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS):
+        self.name = f'{db_username}@{db_host}/{db_name}'
+        self.max_conn = max_conn
+        options = f'-c statement_timeout={statement_timeout_ms}' if statement_timeout_ms else None
+        self.pool = pg_pool.ThreadedConnectionPool(min_conn, max_conn, host=db_host, database=db_name,
+                                                   user=db_username, password=db_password, options=options)
+        # ThreadedConnectionPool raises when exhausted, the semaphore makes borrowers wait for a free connection
+        self.slots = threading.BoundedSemaphore(max_conn)
+        self.lock = threading.RLock() # re-entered when checkout reclaims closed connections
+        self.checked_out = set()
+        self.seen = set()
+        self.metrics = {'checkouts': 0, 'in_use': 0, 'peak_in_use': 0, 'wait_seconds': 0.0,
+                        'connections_opened': 0, 'connections_discarded': 0}
+
+    @classmethod
+    def get(cls, db_name, db_host, db_username, db_password, **kwargs):
+        '''shared pool for these credentials, created on first use'''
+        key = (db_host, db_name, db_username)
+        with cls._pools_lock:
+            if key not in cls._pools:
+                cls._pools[key] = cls(db_name, db_host, db_username, db_password, **kwargs)
+                logging.info(f"Connection pool for {cls._pools[key].name} created.")
+            return cls._pools[key]
+
+    @classmethod
+    def release(cls, conn):
+        '''hand back a connection without knowing which pool it came from'''
+        with cls._pools_lock:
+            pools = list(cls._pools.values())
+        for pool in pools:
+            pool.checkin(conn)
+
+    def _reclaim_closed(self):
+        # connections closed by the borrower (conn.close()) never come back through checkin
+        for conn in [c for c in self.checked_out if c.closed]:
+            self.checkin(conn)
+
+    def checkout(self):
+        with self.lock:
+            self._reclaim_closed()
+        start = time.perf_counter()
+        self.slots.acquire()
+        waited = time.perf_counter() - start
+        try:
+            conn = self.pool.getconn()
+            if conn.closed:
+                # dropped by the server while idle in the pool
+                self.pool.putconn(conn, close=True)
+                self.metrics['connections_discarded'] += 1
+                conn = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.checked_out.add(conn)
+            if id(conn) not in self.seen:
+                self.seen.add(id(conn))
+                self.metrics['connections_opened'] += 1
+            self.metrics['checkouts'] += 1
+            self.metrics['wait_seconds'] += waited
+            self.metrics['in_use'] = len(self.checked_out)
+            self.metrics['peak_in_use'] = max(self.metrics['peak_in_use'], self.metrics['in_use'])
+        return conn
+
+    def checkin(self, conn):
+        '''hand a connection back; an open transaction is rolled back by the pool, a closed connection is discarded'''
+        with self.lock:
+            if conn not in self.checked_out:
+                return
+            self.checked_out.discard(conn)
+            self.metrics['in_use'] = len(self.checked_out)
+            if conn.closed:
+                self.seen.discard(id(conn))
+                self.metrics['connections_discarded'] += 1
+        self.pool.putconn(conn, close=bool(conn.closed))
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.checkout()
+        try:
+            yield conn
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.checkin(conn)
+
+    def get_metrics(self):
+        with self.lock:
+            return dict(self.metrics, max_conn=self.max_conn)
+
+    @classmethod
+    def close_all(cls):
+        with cls._pools_lock:
+            for pool in cls._pools.values():
+                logging.info(f"Connection pool {pool.name}: {pool.get_metrics()}")
+                pool.pool.closeall()
+            cls._pools.clear()
+
+atexit.register(db_pool.close_all)
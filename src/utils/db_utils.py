@@ -5,20 +5,21 @@ from psycopg2 import OperationalError
 from psycopg2.extras import execute_values
 from datetime import datetime 
 import json
+from utils.db_pool import db_pool
 
 def connect_to_db(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD):
+    '''connection borrowed from the shared pool, hand it back with release_db(conn)'''
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USERNAME,
-            password=DB_PASSWORD)
+        conn = db_pool.get(DB_NAME, DB_HOST, DB_USERNAME, DB_PASSWORD).checkout()
         print(f"Connected to {DB_HOST} {DB_NAME}!")
         return conn
     except OperationalError as e:
         print(f"{e}")
         return None
 
+def release_db(conn):
+    db_pool.release(conn)
+
 # general functions
 def convert_to_float(value):
     if value is None or value == "":
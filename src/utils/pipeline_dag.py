@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import *
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M' #datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+class pipeline_dag:
+    '''pipeline stages declared with their dependencies and run in one process: a stage starts as soon as everything
+       it depends on has succeeded, independent stages run concurrently on threads and share the context dict
+       (and the process-wide db pool). a failed stage skips everything downstream of it.
+       a stage is func(context) returning its row count (or None).
+            dag = pipeline_dag('coin_daily')
+            dag.add_stage('price_download', download_prices)
+            dag.add_stage('coint_signal', coint_signal, depends_on=['price_download'])
+            report = dag.run({'db': db_credentials})
+    '''
+    def __init__(self, name, max_workers=PIPELINE_MAX_WORKERS):
+        # every running stage holds a pooled connection and a loading stage one more per loader thread,
+        # a pool smaller than that would block stages waiting on each other's connections
+        if max_workers + PIPELINE_LOADER_THREADS > DB_POOL_MAX_CONN:
+            raise ValueError(f"{max_workers} workers + {PIPELINE_LOADER_THREADS} loader threads need {max_workers + PIPELINE_LOADER_THREADS} "
+                             f"pooled connections, DB_POOL_MAX_CONN is {DB_POOL_MAX_CONN}")
+        self.name = name
+        self.max_workers = max_workers
+        self.stages = {}
+
+    def add_stage(self, name, func, depends_on=()):
+        # dependencies must already be declared, which keeps the graph acyclic
+        unknown = [dep for dep in depends_on if dep not in self.stages]
+        if unknown:
+            raise ValueError(f"Stage {name} depends on undeclared stages: {unknown}")
+        self.stages[name] = (func, list(depends_on))
+        return self
+
+    def _run_stage(self, name, context):
+        func, depends_on = self.stages[name]
+        result = {'stage': name, 'depends_on': depends_on, 'started': datetime.now().isoformat(timespec='seconds'), 'rows': None}
+        logging.info(f"--- {self.name}: start {name}")
+        start = time.perf_counter()
+        try:
+            result['rows'] = func(context)
+            result['status'] = 'succeeded'
+        except Exception as e:
+            logging.exception(f"--- {self.name}: {name} failed: {e}")
+            result['status'] = 'failed'
+            result['error'] = str(e)
+        result['seconds'] = round(time.perf_counter() - start, 2)
+        logging.info(f"--- {self.name}: {name} {result['status']} in {result['seconds']}s")
+        return result
+
+    def run(self, context=None, report_path=RUN_REPORT_PATH):
+        '''runs every stage, returns the run report (also saved as json under report_path)'''
+        context = {} if context is None else context
+        started = datetime.now()
+        start = time.perf_counter()
+        results = {}
+        pending = list(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    statuses = [results[dep]['status'] if dep in results else None for dep in self.stages[name][1]]
+                    if any(status in ('failed', 'skipped') for status in statuses):
+                        results[name] = {'stage': name, 'depends_on': self.stages[name][1], 'status': 'skipped', 'rows': None, 'seconds': 0.0}
+                        logging.warning(f"--- {self.name}: skip {name}, an upstream stage did not succeed")
+                        pending.remove(name)
+                    elif all(status == 'succeeded' for status in statuses):
+                        running[executor.submit(self._run_stage, name, context)] = name
+                        pending.remove(name)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        report = {
+            'pipeline': self.name,
+            'started': started.isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - start, 2),
+            'succeeded': all(result['status'] == 'succeeded' for result in results.values()),
+            'stages': [results[name] for name in self.stages],
+        }
+        for result in report['stages']:
+            logging.info(f"{result['stage']:<20} {result['status']:<10} {result['seconds']:>8}s  rows={result['rows']}")
+        logging.info(f"{self.name} finished in {report['seconds']}s")
+        if report_path:
+            os.makedirs(report_path, exist_ok=True)
+            with open(f"{report_path}/{self.name}_{started:%Y%m%d_%H%M%S}.json", 'w') as file:
+                json.dump(report, file, indent=4, default=str)
+        return report
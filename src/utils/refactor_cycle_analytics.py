@@ -0,0 +1,228 @@
+import time
+import numpy as np
+import pandas as pd
+from config import *
+from utils.db_pool import db_pool
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M' #datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+'''CYCLE ANALYTICS (replaces sql/query_alt_coin_minmax_cycle.sql)
+  analytics = cycle_roi_analytics.from_db(*DB_CREDENTIALS, 'alt_analysis_historical_price', btc_symbol='BTCUSDT')
+  metrics = analytics.range_metrics([('2018-12-16', '2019-06-28'), ('2019-06-28', '2021-11-01')])
+  halves = analytics.compare_halves({'2018 cycle': (('2018-12-16', '2019-06-28'), ('2019-06-28', '2021-11-01'))})
+
+The (date x symbol) close matrix is loaded once, every range is reduced over all symbols at once with numpy,
+results are cached per (range, universe) so overlapping cycle definitions only compute new ranges.
+'''
+
+RANGE_METRICS = ['data_points', 'start_price', 'end_price', 'roi', 'minmax_roi', 'max_drawdown',
+                 'btc_roi', 'btc_minmax_roi', 'relative_roi', 'relative_minmax_roi', 'rank']
+
+def descending_min_rank(values):
+    '''SQL RANK() OVER (ORDER BY values DESC): 1 + number of larger values, NaN stays NaN'''
+    ordered = np.sort(values[~np.isnan(values)])
+    ranks = len(ordered) - np.searchsorted(ordered, values, side='right') + 1.0
+    ranks[np.isnan(values)] = np.nan
+    return ranks
+
+class cycle_roi_analytics:
+    '''ROI, min/max ROI and drawdown of every symbol over date ranges, relative to BTC over the same range.
+       percentages like the SQL: roi = (end - start) / start * 100, minmax_roi = (max - min) / min * 100,
+       max_drawdown = largest peak to trough fall * 100. rank orders relative_minmax_roi (SQL RANK()).
+    '''
+    def __init__(self, price_df, btc_symbol='BTCUSDT'):
+        '''price_df: close prices, dates as index and one column per symbol (NaN where a symbol has no bar)'''
+        if btc_symbol not in price_df.columns:
+            raise ValueError(f"{btc_symbol} not in the price data")
+        price_df = price_df.sort_index()
+        self.dates = pd.DatetimeIndex(price_df.index)
+        self.symbols = price_df.columns.to_numpy()
+        self.prices = price_df.to_numpy(dtype=float)
+        self.btc_symbol = btc_symbol
+        self.btc_column = price_df.columns.get_loc(btc_symbol)
+        self._range_cache = {}
+        self._table_cache = {}
+
+    @classmethod
+    def from_db(cls, db_name, db_host, db_username, db_password, price_table, btc_symbol='BTCUSDT', start_date=None):
+        '''one query for the whole close matrix of price_table'''
+        where_clause = f"WHERE date >= '{start_date}'" if start_date else ""
+        with db_pool.get(db_name, db_host, db_username, db_password).connection() as conn:
+            df = pd.read_sql(f"SELECT date, symbol, close FROM {price_table} {where_clause}", conn)
+        df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_localize(None)
+        df['close'] = df['close'].astype(float)
+        price_df = df.drop_duplicates(subset=['date', 'symbol']).pivot(index='date', columns='symbol', values='close')
+        logging.info(f"Loaded {price_df.shape[0]} dates x {price_df.shape[1]} symbols from {price_table}")
+        return cls(price_df, btc_symbol)
+
+    def _row_bounds(self, date_range):
+        # BETWEEN start AND end, both inclusive
+        start, end = pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1])
+        return self.dates.searchsorted(start, side='left'), self.dates.searchsorted(end, side='right')
+
+    def _range_arrays(self, date_range):
+        '''per symbol metrics of one range, every symbol in one pass over the range rows'''
+        key = (str(date_range[0]), str(date_range[1]))
+        if key in self._range_cache:
+            return self._range_cache[key]
+
+        lower, upper = self._row_bounds(date_range)
+        window = self.prices[lower:upper]
+        if not len(window):
+            window = np.full((1, len(self.symbols)), np.nan)
+        valid = ~np.isnan(window)
+        data_points = valid.sum(axis=0)
+        has_data = data_points > 0
+        # first / last bar of each symbol inside the range (listing and delisting dates differ)
+        columns = np.arange(window.shape[1])
+        first = valid.argmax(axis=0)
+        last = len(window) - 1 - valid[::-1].argmax(axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            start_price = np.where(has_data, window[first, columns], np.nan)
+            end_price = np.where(has_data, window[last, columns], np.nan)
+            low = np.where(has_data, np.where(valid, window, np.inf).min(axis=0), np.nan)
+            high = np.where(has_data, np.where(valid, window, -np.inf).max(axis=0), np.nan)
+            # NaN bars keep the running peak (fmax ignores NaN)
+            peak = np.fmax.accumulate(window, axis=0)
+            drawdown = np.where(has_data, np.where(valid, 1 - window / peak, -np.inf).max(axis=0), np.nan)
+            arrays = {
+                'data_points': data_points,
+                'start_price': start_price,
+                'end_price': end_price,
+                'roi': (end_price - start_price) / start_price * 100,
+                'minmax_roi': (high - low) / low * 100,
+                'max_drawdown': drawdown * 100,
+            }
+        self._range_cache[key] = arrays
+        return arrays
+
+    def _universe_columns(self, universe):
+        if universe is None:
+            return np.flatnonzero(self.symbols != self.btc_symbol)
+        wanted = set(universe) - {self.btc_symbol}
+        missing = wanted - set(self.symbols)
+        if missing:
+            logging.warning(f"Symbols not in the price data: {sorted(missing)}")
+        return np.flatnonzero(np.isin(self.symbols, list(wanted)))
+
+    def _range_table(self, date_range, universe):
+        key = (str(date_range[0]), str(date_range[1]), universe)
+        if key in self._table_cache:
+            return self._table_cache[key]
+
+        arrays = self._range_arrays(date_range)
+        columns = self._universe_columns(universe)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative_roi = arrays['roi'][columns] / arrays['roi'][self.btc_column]
+            relative_minmax_roi = arrays['minmax_roi'][columns] / arrays['minmax_roi'][self.btc_column]
+        # every universe symbol stays in the cached table (same row order for every range), symbols without a bar
+        # in the range get no rank and are dropped from the outputs, like the GROUP BY of the SQL
+        has_data = arrays['data_points'][columns] > 0
+        table = pd.DataFrame({
+            'start_date': pd.Timestamp(date_range[0]),
+            'end_date': pd.Timestamp(date_range[1]),
+            'symbol': self.symbols[columns],
+            **{name: values[columns] for name, values in arrays.items()},
+            'btc_roi': arrays['roi'][self.btc_column],
+            'btc_minmax_roi': arrays['minmax_roi'][self.btc_column],
+            'relative_roi': relative_roi,
+            'relative_minmax_roi': relative_minmax_roi,
+            'rank': pd.array(descending_min_rank(np.where(has_data, relative_minmax_roi, np.nan)), dtype='Int64'),
+        })
+        self._table_cache[key] = table
+        return table
+
+    def range_metrics(self, date_ranges, universe=None):
+        '''one row per (range, symbol): start_date, end_date, symbol and RANGE_METRICS.
+           universe: symbols to report (BTC is always the benchmark), default every symbol but BTC'''
+        universe = None if universe is None else tuple(sorted(set(universe)))
+        tables = [self._range_table(date_range, universe) for date_range in date_ranges]
+        if not tables:
+            return pd.DataFrame(columns=['start_date', 'end_date', 'symbol'] + RANGE_METRICS)
+        output = pd.concat(tables, ignore_index=True)
+        return output[output['data_points'] > 0].reset_index(drop=True)
+
+    def compare_halves(self, cycles, universe=None, metric='relative_minmax_roi'):
+        '''rank change between the two halves of every cycle, cycles: {name: (first_range, second_range)}.
+           each half is ranked on metric over the symbols with data in it, then the halves are joined on symbol.
+           one row per (cycle, symbol with data in both halves), first_half_rank order like the SQL'''
+        universe = None if universe is None else tuple(sorted(set(universe)))
+        outputs = []
+        for name, (first_range, second_range) in cycles.items():
+            first = self._range_table(first_range, universe)
+            second = self._range_table(second_range, universe)
+            ranks = []
+            for table in (first, second):
+                if metric == 'relative_minmax_roi':
+                    ranks.append(table['rank'].to_numpy(dtype=float, na_value=np.nan))
+                else:
+                    ranks.append(descending_min_rank(np.where(table['data_points'] > 0, table[metric], np.nan)))
+            # the cached tables share the symbol order, no merge needed
+            both = (first['data_points'].to_numpy() > 0) & (second['data_points'].to_numpy() > 0)
+            # a NaN metric (e.g. no BTC bars in the half) has no rank: nullable Int64 keeps it as <NA>
+            first_rank, second_rank = (pd.array(rank[both], dtype='Int64') for rank in ranks)
+            output = pd.DataFrame({
+                'cycle': name,
+                'symbol': first['symbol'].to_numpy()[both],
+                'first_half_rank': first_rank,
+                'first_half_roi': first[metric].to_numpy()[both],
+                'second_half_rank': second_rank,
+                'second_half_roi': second[metric].to_numpy()[both],
+                'rank_change': second_rank - first_rank,
+            })
+            outputs.append(output.sort_values('first_half_rank', kind='mergesort'))
+        return pd.concat(outputs, ignore_index=True) if outputs else pd.DataFrame()
+
+    def clear_cache(self):
+        self._range_cache.clear()
+        self._table_cache.clear()
+
+
+# Benchmark against the per range / per symbol evaluation of the SQL, run from src/: python -m utils.refactor_cycle_analytics
+if __name__ == "__main__":
+    def sql_like_metrics(long_df, date_range, btc_symbol):
+        '''query_alt_coin_minmax_cycle.sql in pandas: filter the long table per range, group by symbol'''
+        in_range = long_df[(long_df['date'] >= date_range[0]) & (long_df['date'] <= date_range[1])]
+        minmax = in_range.groupby('symbol')['close'].agg(lambda close: (close.max() - close.min()) / close.min() * 100)
+        relative = minmax.drop(btc_symbol) / minmax[btc_symbol]
+        return relative.rank(method='min', ascending=False)
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2017-01-01', '2025-01-01', freq='D')
+    price_df = pd.DataFrame(np.exp(np.cumsum(rng.normal(0, 0.04, (len(dates), 300)), axis=0)), index=dates,
+                            columns=['BTCUSDT'] + [f'COIN{i}USDT' for i in range(299)])
+    for i, listed in enumerate(rng.integers(0, len(dates) // 2, 300)[1:], start=1):
+        price_df.iloc[:listed, i] = np.nan
+    long_df = price_df.stack().dropna().rename('close').reset_index().rename(columns={'level_0': 'date', 'level_1': 'symbol'})
+
+    # 40 cycles: half ranges from every quarter start
+    starts = pd.date_range('2018-01-01', '2022-12-31', freq='QS')
+    cycles = {f'cycle {start.date()}': ((start, start + pd.Timedelta(days=180)),
+                                        (start + pd.Timedelta(days=180), start + pd.Timedelta(days=700))) for start in starts}
+    date_ranges = [date_range for halves in cycles.values() for date_range in halves]
+
+    start = time.perf_counter()
+    expected = [sql_like_metrics(long_df, date_range, 'BTCUSDT') for date_range in date_ranges]
+    sql_like_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analytics = cycle_roi_analytics(price_df, btc_symbol='BTCUSDT')
+    halves = analytics.compare_halves(cycles)
+    engine_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analytics.compare_halves(cycles)
+    cached_time = time.perf_counter() - start
+
+    metrics = analytics.range_metrics(date_ranges)
+    for date_range, ranks in zip(date_ranges, expected):
+        actual = metrics[(metrics['start_date'] == date_range[0]) & (metrics['end_date'] == date_range[1])].set_index('symbol')['rank']
+        assert (actual.reindex(ranks.index).astype(float) == ranks).all()
+    logging.info(f"{len(date_ranges)} ranges x {price_df.shape[1]} symbols | per range group by: {sql_like_time:.2f}s | "
+                 f"matrix: {engine_time * 1000:.0f}ms ({sql_like_time / engine_time:.0f}x) | cached: {cached_time * 1000:.0f}ms")
@@ -7,7 +7,6 @@ from requests.exceptions import ConnectionError, Timeout, TooManyRedirects
 import requests
 import time
 import os
-from binance.client import Client
 
 logging.basicConfig(
     level=logging.INFO,
@@ -100,16 +99,23 @@ class coin_gecko_daily_ohlc_api_getter(api_getter):
                 break
         return all_data
 
-    def download_data(self):
+    def download_data(self, on_downloaded=None, on_overview=None):
+        '''on_overview(path) is called once the overview file is saved, on_downloaded(path) after every symbol file,
+           so a loader can start inserting while the rest is still downloading'''
         ids, symbols = self._get_download_symbol_list()
+        if on_overview is not None:
+            on_overview(self.overview_save_path)
         
         logging.debug(f"start downloading symbol list:{symbols}") 
         
         for id, symbol in zip(ids, symbols):
             all_data = self._download_single_symbol(id, symbol)
-            with open(self.data_save_path+f'/{symbol}.json', 'w') as file:
+            file_path = self.data_save_path+f'/{symbol}.json'
+            with open(file_path, 'w') as file:
                 json.dump(all_data, file, indent=4)
             logging.info(f"Saved full data for {symbol} to {symbol}.json")
+            if on_downloaded is not None:
+                on_downloaded(file_path)
          
 class coin_gecko_hourly_ohlc_api_getter(coin_gecko_daily_ohlc_api_getter):     
     '''slight change of download_data from daily ohlc api'''
@@ -146,6 +152,7 @@ class binance_ohlc_api_getter(coin_gecko_daily_ohlc_api_getter):
         super().__init__(api_key, data_save_path, None, None)
         self.num_download_symbols = TOP_N_COINS_DOWNLOADED_FROM_BINANCE
         self.api_secret = api_secret
+        from binance.client import Client # slow to import, only the binance getter needs it
         self.client = Client(self.api_key, self.api_secret)
         self.interval = interval
         self.start_date = start_date
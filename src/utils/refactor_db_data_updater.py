@@ -6,7 +6,11 @@ import psycopg2
 from psycopg2 import OperationalError
 from psycopg2.extras import execute_values
 from config import *
+from utils.db_pool import db_pool
 import logging
+import queue
+import threading
+import time
 from datetime import datetime
 
 logging.basicConfig(
@@ -59,9 +63,8 @@ def truncate_string(value, length):
         return None
 
 
-class db_refresher(ABC): 
-    '''object that 1) connect to db 2) transform and insert json data depends on source.
-       template for coin_gecko_db and avan_stock_db'''
+class db_table_base:
+    '''connection and table lifecycle shared by the refreshers: borrow a pooled connection, create / drop table_name'''
     def __init__(self, db_name, db_host, db_username, db_password, table_name):
         self.db_name = db_name
         self.db_host = db_host
@@ -73,12 +76,10 @@ class db_refresher(ABC):
         self.data_insertion_script = None  # This will be set in child classes
          
     def connect(self):
+        '''borrow a connection from the shared pool, see utils.db_pool'''
         try:
-            self.conn = psycopg2.connect(
-                host=self.db_host,
-                database=self.db_name,
-                user=self.db_username,
-                password=self.db_password)
+            self.pool = db_pool.get(self.db_name, self.db_host, self.db_username, self.db_password)
+            self.conn = self.pool.checkout()
             print(f"Connected to {self.db_host} {self.db_name}!")
         except OperationalError as e:
             print(f"Error connecting to database: {e}")
@@ -86,8 +87,16 @@ class db_refresher(ABC):
 
     def close(self):
         if self.conn:
-            self.conn.close()
-            print("Database connection closed.")
+            self.pool.checkin(self.conn)
+            self.conn = None
+            print("Database connection returned to pool.")
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
       
     def create_table(self):
         cursor = self.conn.cursor()
@@ -112,24 +121,85 @@ class db_refresher(ABC):
             self.conn.rollback()
         finally:
             cursor.close()
-    
+
+
+class db_refresher(db_table_base, ABC): 
+    '''object that 1) connect to db 2) transform and insert json data depends on source.
+       template for coin_gecko_db and avan_stock_db'''
     @abstractmethod
     def _data_transformation(self, file_path):
         pass
     
     def insert_data(self, file_path):
+        '''returns the number of rows sent, 0 when the insert failed'''
         time_series_data = self._data_transformation(file_path)
         cursor = self.conn.cursor()
         try:
             execute_values(cursor, self.data_insertion_script, time_series_data)
             self.conn.commit()
             logging.debug(f"Inserted into {self.table_name} from {file_path}")
+            return len(time_series_data)
         except Exception as e:
             logging.error(f"Failed to insert data from {file_path}: {e}")
             self.conn.rollback()
+            return 0
         finally:
             cursor.close()
 
+class threaded_file_loader:
+    '''runs refresher.insert_data on a background thread for every submitted file, so inserts overlap with downloads.
+       the refresher borrows its own pooled connection inside the thread.
+            loader = threaded_file_loader(coin_gecko_OHLC_db_refresher(...)).start()
+            api_getter.download_data(on_downloaded=loader.submit)
+            stats = loader.finish()
+    '''
+    _done = object()
+
+    def __init__(self, refresher, create_table=True):
+        self.refresher = refresher
+        self.create_table = create_table
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f'{refresher.table_name}_loader', daemon=True)
+        self.stats = {'table': refresher.table_name, 'files': 0, 'rows': 0, 'failed': 0, 'busy_seconds': 0.0, 'wall_seconds': 0.0}
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def submit(self, file_path):
+        self.queue.put(file_path)
+
+    def _run(self):
+        self.refresher.connect()
+        if self.refresher.conn is None:
+            logging.error(f"{self.refresher.table_name} loader has no connection, nothing will be loaded")
+            return
+        try:
+            if self.create_table:
+                self.refresher.create_table()
+            while True:
+                file_path = self.queue.get()
+                if file_path is self._done:
+                    break
+                start = time.perf_counter()
+                try:
+                    self.stats['rows'] += self.refresher.insert_data(file_path) or 0
+                    self.stats['files'] += 1
+                except Exception as e:
+                    logging.error(f"Failed to load {file_path} into {self.refresher.table_name}: {e}")
+                    self.stats['failed'] += 1
+                self.stats['busy_seconds'] += time.perf_counter() - start
+        finally:
+            self.refresher.close()
+
+    def finish(self):
+        '''wait for every submitted file to be loaded, returns the load stats'''
+        self.queue.put(self._done)
+        self.thread.join()
+        self.stats['wall_seconds'] = time.perf_counter() - self.start_time
+        return self.stats
+
 class binance_OHLC_db_refresher(db_refresher):
     '''handle all data insertion from OHLC data via binance api'''
     def __init__(self, *args):
@@ -1272,4 +1342,108 @@ class avan_stock_economic_db_refresher(db_refresher):
             return transformed_data
         except Exception as e:
             logging.error(f"Data transformation failed for {file_path}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+
+class btc_relative_metrics_db_refresher(db_table_base):
+    '''derived per symbol/date metrics of a daily price table: price_in_btc, the 140 day SMA of the price and of
+       price_in_btc and the above-SMA flags, stored in {source_table}_btc_metrics for the cycle analytics in sql/.
+       refresh_metrics() only computes bars newer than the stored ones (plus the last settle_days, which the daily
+       price load can restate); their windows are completed with the stored rows before them, not the full history.
+            with btc_relative_metrics_db_refresher(*DB_CREDENTIALS, 'cg_coin_hist_price', 'BTC') as db:
+                db.create_table()
+                db.refresh_metrics()
+       delete_table() + create_table() rebuilds from scratch.
+    '''
+    SMA_WINDOW = 140
+
+    def __init__(self, db_name, db_host, db_username, db_password, source_table, btc_symbol='BTCUSDT',
+                 settle_days=BTC_METRICS_SETTLE_DAYS):
+        super().__init__(db_name, db_host, db_username, db_password, f"{source_table}_btc_metrics")
+        self.source_table = source_table
+        self.btc_symbol = btc_symbol
+        self.settle_days = settle_days
+
+        self.table_creation_script = f"""
+        CREATE TABLE IF NOT EXISTS {self.table_name} (
+            symbol VARCHAR(20) NOT NULL,
+            date TIMESTAMPTZ NOT NULL,
+            close NUMERIC NOT NULL,
+            price_in_btc NUMERIC NOT NULL,
+            sma_140d NUMERIC,
+            to_btc_sma_140d NUMERIC,
+            above_140d_sma SMALLINT,
+            to_btc_above_140d_sma SMALLINT,
+            PRIMARY KEY (symbol, date)
+        );
+        CREATE INDEX IF NOT EXISTS {self.table_name}_date_idx ON {self.table_name} (date);
+        """
+
+        preceding = self.SMA_WINDOW - 1
+        self.data_insertion_script = f"""
+        INSERT INTO {self.table_name} (symbol, date, close, price_in_btc, sma_140d, to_btc_sma_140d,
+                                       above_140d_sma, to_btc_above_140d_sma)
+        WITH latest AS (
+            SELECT symbol, MAX(date) - INTERVAL '{self.settle_days} days' AS recompute_from
+            FROM {self.table_name}
+            GROUP BY symbol
+        ),
+        btc_prices AS (
+            SELECT date, close
+            FROM {self.source_table}
+            WHERE symbol = %(btc_symbol)s
+        ),
+        new_bars AS (
+            SELECT a.symbol, a.date, a.close, a.close / b.close AS price_in_btc, TRUE AS is_new
+            FROM {self.source_table} a
+            JOIN btc_prices b ON a.date = b.date
+            LEFT JOIN latest l ON a.symbol = l.symbol
+            WHERE l.recompute_from IS NULL OR a.date > l.recompute_from
+        ),
+        stored_bars AS (
+            SELECT s.symbol, s.date, s.close, s.price_in_btc, FALSE AS is_new
+            FROM latest l
+            CROSS JOIN LATERAL (
+                SELECT symbol, date, close, price_in_btc
+                FROM {self.table_name} t
+                WHERE t.symbol = l.symbol AND t.date <= l.recompute_from
+                ORDER BY t.date DESC
+                LIMIT {preceding}
+            ) s
+        ),
+        add_ta AS (
+            SELECT *,
+                AVG(close) OVER w AS sma_140d,
+                AVG(price_in_btc) OVER w AS to_btc_sma_140d
+            FROM (SELECT * FROM new_bars UNION ALL SELECT * FROM stored_bars) bars
+            WINDOW w AS (PARTITION BY symbol ORDER BY date ROWS BETWEEN {preceding} PRECEDING AND CURRENT ROW)
+        )
+        SELECT symbol, date, close, price_in_btc, sma_140d, to_btc_sma_140d,
+            CASE WHEN close >= sma_140d THEN 1 ELSE 0 END,
+            CASE WHEN price_in_btc >= to_btc_sma_140d THEN 1 ELSE 0 END
+        FROM add_ta
+        WHERE is_new
+        ON CONFLICT (symbol, date) DO UPDATE SET
+            close = EXCLUDED.close,
+            price_in_btc = EXCLUDED.price_in_btc,
+            sma_140d = EXCLUDED.sma_140d,
+            to_btc_sma_140d = EXCLUDED.to_btc_sma_140d,
+            above_140d_sma = EXCLUDED.above_140d_sma,
+            to_btc_above_140d_sma = EXCLUDED.to_btc_above_140d_sma;
+        """
+
+    def refresh_metrics(self):
+        '''compute the metrics of the bars loaded since the last refresh. returns the number of rows written, 0 on failure'''
+        start = time.perf_counter()
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(self.data_insertion_script, {'btc_symbol': self.btc_symbol})
+            self.conn.commit()
+            logging.info(f"Refreshed {cursor.rowcount} rows of {self.table_name} in {time.perf_counter() - start:.1f}s")
+            return cursor.rowcount
+        except Exception as e:
+            logging.error(f"Failed to refresh {self.table_name}: {e}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
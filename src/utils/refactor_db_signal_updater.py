@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
+import io
+import time
+import numpy as np
 import pandas as pd
 import psycopg2
 from psycopg2 import OperationalError
 from psycopg2.extras import execute_values
 from config import *
+from utils.db_pool import db_pool
+from utils.refactor_indicator_engine import indicator_columns
 import logging
 
 logging.basicConfig(
@@ -12,24 +17,53 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M' #datefmt='%Y-%m-%d %H:%M:%S'
 )
 
+# postgres binary COPY framing; timestamps are microseconds since 2000-01-01
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + (0).to_bytes(4, 'big') + (0).to_bytes(4, 'big')
+PGCOPY_TRAILER = (-1).to_bytes(2, 'big', signed=True)
+PG_EPOCH = np.datetime64('2000-01-01T00:00:00', 'us')
+
+def pgcopy_binary(columns):
+    '''columns: list of numpy arrays already cast to the big-endian type of the target column (e.g. '>i8', '>i4', '>f8').
+       packs them into one binary COPY buffer with a structured array, no per-row python objects'''
+    fields = [('field_count', '>i2')]
+    for i, values in enumerate(columns):
+        fields += [(f'len{i}', '>i4'), (f'val{i}', values.dtype)]
+    rows = np.empty(len(columns[0]), dtype=np.dtype(fields))
+    rows['field_count'] = len(columns)
+    for i, values in enumerate(columns):
+        rows[f'len{i}'] = values.dtype.itemsize
+        rows[f'val{i}'] = values
+    buffer = io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    buffer.write(rows.data)
+    buffer.write(PGCOPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
 class db_signal_updater(ABC): 
     '''object that 1) connect to db 2) ingest input data 3) insert output to db. 
     Template for stock and coin cointegration index calculation.
     '''
+    output_table = None # pairs coint table written by insert_output_data
+    partitioned_output = PAIRS_COINT_PARTITIONED
+    price_table = None # daily closes, signal_table: hedge ratios per pair, spread_table: pairs_spread_signal_calculator output
+    signal_table = None
+    spread_table = None
+    indicator_table = None # calculate_indicators output per (symbol, date)
+
     def __init__(self, db_name, db_host, db_username, db_password):
         self.db_name = db_name
         self.db_host = db_host
         self.db_username = db_username
         self.db_password = db_password
         self.conn = None
+        self.changed_pairs = None # (symbol1, symbol2) of primary-window signals written in this run
 
     def connect(self):
+        '''borrow a connection from the shared pool, see utils.db_pool'''
         try:
-            self.conn = psycopg2.connect(
-                host=self.db_host,
-                database=self.db_name,
-                user=self.db_username,
-                password=self.db_password)
+            self.pool = db_pool.get(self.db_name, self.db_host, self.db_username, self.db_password)
+            self.conn = self.pool.checkout()
             logging.info(f"Connected to {self.db_host} {self.db_name}!")
         except OperationalError as e:
             logging.error(f"Error connecting to database: {e}")
@@ -37,8 +71,235 @@ class db_signal_updater(ABC):
 
     def close(self):
         if self.conn:
-            self.conn.close()
-            logging.info("Database connection closed.")
+            self.pool.checkin(self.conn)
+            self.conn = None
+            logging.info("Database connection returned to pool.")
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _copy_output_data(self, output_df):
+        '''bulk path for insert_output_data: binary COPY of (date, pair_id, pvalue) into a staging table,
+           one merge into self.output_table and a single commit'''
+
+        # pairs dimension: one row per (symbol1, symbol2, window_length), rows only carry its id
+        pair_ids, pairs = pd.MultiIndex.from_arrays(
+            [output_df.iloc[:, 2], output_df.iloc[:, 3], output_df.iloc[:, 1]]).factorize()
+        dates = pd.to_datetime(output_df.iloc[:, 0]).to_numpy(dtype='datetime64[us]')
+        buffer = pgcopy_binary([
+            (dates - PG_EPOCH).astype('>i8'),
+            pair_ids.astype('>i4'),
+            output_df.iloc[:, 4].to_numpy(dtype='>f8'),
+        ])
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS pairs_coint_staging_pairs (
+                pair_id INT NOT NULL,
+                symbol1 VARCHAR(50) NOT NULL,
+                symbol2 VARCHAR(50) NOT NULL,
+                window_length INT NOT NULL
+            ) ON COMMIT DROP;
+            CREATE TEMP TABLE IF NOT EXISTS pairs_coint_staging (
+                date TIMESTAMP NOT NULL,
+                pair_id INT NOT NULL,
+                pvalue DOUBLE PRECISION
+            ) ON COMMIT DROP;
+            """)
+            execute_values(cursor, "INSERT INTO pairs_coint_staging_pairs VALUES %s",
+                           [(i, s1, s2, int(w)) for i, (s1, s2, w) in enumerate(pairs)], page_size=1000)
+            cursor.copy_expert("COPY pairs_coint_staging (date, pair_id, pvalue) FROM STDIN WITH (FORMAT BINARY)", buffer)
+            # naive timestamps go through the session time zone, same as the execute_values path
+            cursor.execute(f"""
+            INSERT INTO {self.output_table} (date, window_length, symbol1, symbol2, pvalue)
+            SELECT s.date::timestamptz, p.window_length, p.symbol1, p.symbol2, s.pvalue
+            FROM pairs_coint_staging s
+            JOIN pairs_coint_staging_pairs p ON s.pair_id = p.pair_id
+            ON CONFLICT (date, window_length, symbol1, symbol2)
+            DO UPDATE SET 
+                pvalue = EXCLUDED.pvalue
+            """)
+            self.conn.commit()
+            logging.info(f"Copied {len(output_df)} rows ({len(pairs)} pairs) into {self.output_table} table.")
+            return len(output_df)
+        except Exception as e:
+            logging.error(f"Failed to copy data: {e}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
+
+    def insert_output_data(self, output_df, bulk=True):
+        '''upsert the (date, window_length, symbol1, symbol2, pvalue) rows into self.output_table, returns the row count.
+           bulk (the default) goes through _copy_output_data, bulk=False through execute_values pages'''
+        output_df = self._prepare_output_table(output_df)
+        if bulk:
+            return self._copy_output_data(output_df)
+
+        csv_as_tuple = list(output_df.itertuples(index=False, name=None))
+        cursor = self.conn.cursor()
+        insert_query = f"""
+        INSERT INTO {self.output_table} (date, window_length, symbol1, symbol2, pvalue)
+        VALUES %s
+        ON CONFLICT (date, window_length, symbol1, symbol2)
+        DO UPDATE SET 
+            pvalue = EXCLUDED.pvalue
+        """
+        try:      
+            chunk_size = 1000  # Increased chunk size for better performance
+            for i in range(0, len(csv_as_tuple), chunk_size):
+                execute_values(cursor, insert_query, csv_as_tuple[i:i+chunk_size])
+            self.conn.commit()
+            logging.info(f"Inserted {len(csv_as_tuple)} rows into {self.output_table} table.")
+            return len(csv_as_tuple)
+        except Exception as e:
+            logging.error(f"Failed to insert data: {e}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
+
+    def _output_retention_cutoff(self):
+        '''first month kept in a partitioned output table, None keeps everything'''
+        if not self.partitioned_output or not PAIRS_COINT_RETENTION_MONTHS:
+            return None
+        return (pd.Timestamp.now().normalize() - pd.DateOffset(months=PAIRS_COINT_RETENTION_MONTHS)).replace(day=1)
+
+    def _prepare_output_table(self, output_df):
+        '''create (or migrate) the output table and make sure it can take output_df, returns the rows to insert'''
+        if not self.partitioned_output:
+            self._create_output_data_table()
+            return output_df
+        dates = pd.to_datetime(output_df.iloc[:, 0])
+        cutoff = self._output_retention_cutoff()
+        if cutoff is not None:
+            output_df, dates = output_df[dates >= cutoff], dates[dates >= cutoff]
+        self._create_output_data_table(dates.min(), dates.max())
+        return output_df
+
+    def _create_partitioned_output_table(self, start_date=None, end_date=None):
+        '''performance layout of the pairs coint table: monthly range partitions on date, DOUBLE PRECISION pvalue
+           and a (symbol1, symbol2, window_length, date) index for per-pair lookups.
+           - a legacy (unpartitioned) table is migrated in place
+           - there is no default partition, so partitions covering start_date..end_date are created up front
+           - partitions older than PAIRS_COINT_RETENTION_MONTHS are dropped'''
+        table = self.output_table
+        cutoff = self._output_retention_cutoff()
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+            row = cursor.fetchone()
+            relkind = row[0] if row else None
+            months = []
+            if relkind == 'r':
+                # move the legacy table (and its primary key name) aside, copy it over below
+                cursor.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+                cursor.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {table}_legacy_pkey")
+                cursor.execute(f"SELECT MIN(date), MAX(date) FROM {table}_legacy")
+                months += [pd.Timestamp(d).tz_localize(None) for d in cursor.fetchone() if d is not None]
+            if relkind != 'p':
+                cursor.execute(f"""
+                CREATE TABLE {table} (
+                    date TIMESTAMPTZ NOT NULL,
+                    window_length INT NOT NULL,
+                    symbol1 VARCHAR(50) NOT NULL,
+                    symbol2 VARCHAR(50) NOT NULL,
+                    pvalue DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (date, window_length, symbol1, symbol2)
+                ) PARTITION BY RANGE (date);
+                CREATE INDEX IF NOT EXISTS {table}_pair_date_idx ON {table} (symbol1, symbol2, window_length, date);
+                """)
+                logging.info(f"{table} partitioned table created successfully.")
+
+            months += [pd.Timestamp(d).tz_localize(None) for d in (start_date, end_date) if not pd.isna(d)]
+            if months:
+                first_month, last_month = min(months).to_period('M'), max(months).to_period('M')
+                if cutoff is not None:
+                    first_month = max(first_month, cutoff.to_period('M'))
+                for month in pd.period_range(first_month, last_month, freq='M'):
+                    cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table}_p{month.strftime('%Y%m')} PARTITION OF {table}
+                    FOR VALUES FROM ('{month.start_time:%Y-%m-%d}') TO ('{(month + 1).start_time:%Y-%m-%d}')
+                    """)
+
+            if relkind == 'r':
+                cursor.execute(f"""
+                INSERT INTO {table} (date, window_length, symbol1, symbol2, pvalue)
+                SELECT date, window_length, symbol1, symbol2, pvalue::double precision
+                FROM {table}_legacy
+                {f"WHERE date >= '{cutoff:%Y-%m-%d}'" if cutoff is not None else ''}
+                """)
+                logging.info(f"Migrated {cursor.rowcount} rows from {table}_legacy.")
+                cursor.execute(f"DROP TABLE {table}_legacy")
+
+            if cutoff is not None:
+                cursor.execute("""
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON i.inhrelid = c.oid
+                WHERE i.inhparent = to_regclass(%s)
+                """, (table,))
+                for (partition,) in cursor.fetchall():
+                    if partition.rsplit('_p', 1)[-1] < cutoff.strftime('%Y%m'):
+                        cursor.execute(f"DROP TABLE {partition}")
+                        logging.info(f"Dropped expired partition {partition}.")
+            self.conn.commit()
+        except Exception as e:
+            logging.error(f"Failed to create partitioned table: {str(e)}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
+    def _track_changed_signals(self, returned_rows):
+        '''collect (symbol1, symbol2) of signal rows the upsert actually inserted or changed'''
+        changed = {(symbol1, symbol2) for symbol1, symbol2, window_length in returned_rows if window_length == ROLLING_COINT_WINDOW}
+        self.changed_pairs = (self.changed_pairs or set()) | changed
+
+    def _changed_pairs_filter(self, signal_columns):
+        '''WHERE clause (and params) picking the api rows to refresh from signal table a / api table o.
+           uses the pairs tracked by insert_signal_data_table, or compares the signal columns when nothing was tracked'''
+        if self.changed_pairs is None:
+            signal_cols = ', '.join(f'a.{col}' for col in signal_columns)
+            api_cols = ', '.join(f'o.{col}' for col in signal_columns)
+            return f"({signal_cols}) IS DISTINCT FROM ({api_cols})", {}
+        pairs = sorted(self.changed_pairs)
+        params = {'symbol1': [pair[0] for pair in pairs], 'symbol2': [pair[1] for pair in pairs]}
+        return "(a.symbol1, a.symbol2) IN (SELECT * FROM unnest(%(symbol1)s::text[], %(symbol2)s::text[]))", params
+
+    def _swap_api_output_table(self, api_table, columns, select_query):
+        '''rebuild api_table from select_query into a shadow table and rename it in, all in one transaction,
+           so readers see either the old or the new table and never a partial one. returns the row count, 0 on failure'''
+        self._create_api_output_table()
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+            DROP TABLE IF EXISTS {api_table}_shadow;
+            CREATE TABLE {api_table}_shadow (LIKE {api_table} INCLUDING ALL);
+            """)
+            cursor.execute(f"""
+            INSERT INTO {api_table}_shadow ({columns})
+            {select_query}
+            ON CONFLICT DO NOTHING;
+            """)
+            rows = cursor.rowcount
+            cursor.execute(f"""
+            ALTER TABLE {api_table} RENAME TO {api_table}_old;
+            ALTER TABLE {api_table}_shadow RENAME TO {api_table};
+            DROP TABLE {api_table}_old;
+            """)
+            self.conn.commit()
+            logging.info(f"{api_table} rebuilt and swapped in ({rows} rows).")
+            return rows
+        except Exception as e:
+            logging.error(f"Failed to rebuild {api_table}: {str(e)}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
 
     def pivot_price_data(self, df):
         df = df.drop_duplicates(subset=['date', 'symbol'])
@@ -47,6 +308,177 @@ class db_signal_updater(ABC):
         transformed_df.reset_index(inplace=True)
         return transformed_df
       
+    def fetch_spread_input_data(self, lookback=SPREAD_LOOKBACK, window_length=ROLLING_COINT_WINDOW):
+        '''pairs of the signal table and the latest `lookback` closes of their symbols as a (date x symbol) matrix,
+           input of pairs_spread_signal_calculator'''
+        pair_signal_df = pd.read_sql(f"""
+        SELECT symbol1, symbol2, window_length, most_recent_coint_pct, recent_coint_pct, hist_coint_pct,
+               r_squared, ols_constant, ols_coeff
+        FROM {self.signal_table}
+        WHERE window_length = {window_length}
+        """, self.conn)
+        price_df = pd.read_sql(f"""
+        WITH symbols AS (
+            SELECT symbol1 AS symbol FROM {self.signal_table} WHERE window_length = {window_length}
+            UNION
+            SELECT symbol2 FROM {self.signal_table} WHERE window_length = {window_length}
+        ),
+        ranked AS (
+            SELECT a.date, a.symbol, a.close, row_number() OVER (PARTITION BY a.symbol ORDER BY a.date DESC) AS rn
+            FROM {self.price_table} a
+            JOIN symbols s ON a.symbol = s.symbol
+        )
+        SELECT date, symbol, close FROM ranked WHERE rn <= {lookback}
+        """, self.conn)
+        price_df = price_df.drop_duplicates(subset=['date', 'symbol']).pivot(index='date', columns='symbol', values='close')
+        return price_df.sort_index(), pair_signal_df
+
+    def _create_spread_table(self):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.spread_table} (
+                symbol1 VARCHAR(50) NOT NULL,
+                symbol2 VARCHAR(50) NOT NULL,
+                window_length INT NOT NULL,
+                date DATE NOT NULL,
+                close1 DOUBLE PRECISION,
+                close2 DOUBLE PRECISION,
+                ols_spread DOUBLE PRECISION,
+                rolling_mean DOUBLE PRECISION,
+                upper_band DOUBLE PRECISION,
+                lower_band DOUBLE PRECISION,
+                z_score DOUBLE PRECISION,
+                key_score DOUBLE PRECISION,
+                investment DOUBLE PRECISION,
+                potential_win DOUBLE PRECISION,
+                potential_win_pct DOUBLE PRECISION,
+                signal SMALLINT NOT NULL,
+                position SMALLINT NOT NULL,
+                backtest_pnl DOUBLE PRECISION,
+                backtest_return_pct DOUBLE PRECISION,
+                trades INT NOT NULL,
+                win_rate DOUBLE PRECISION,
+                most_recent_coint_pct NUMERIC,
+                recent_coint_pct NUMERIC,
+                hist_coint_pct NUMERIC,
+                r_squared NUMERIC,
+                ols_constant NUMERIC,
+                ols_coeff NUMERIC,
+                PRIMARY KEY (symbol1, symbol2, window_length)
+            );
+            """)
+            self.conn.commit()
+            logging.info(f"{self.spread_table} table created successfully.")
+        except Exception as e:
+            logging.error(f"Failed to create table: {str(e)}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
+    def insert_spread_data(self, spread_df):
+        '''replaces the spread table with this run (one row per pair) in one transaction, returns the row count'''
+        self._create_spread_table()
+        columns = list(spread_df.columns)
+        spread_df = spread_df.astype(object).where(spread_df.notna(), None)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"DELETE FROM {self.spread_table}")
+            execute_values(cursor, f"INSERT INTO {self.spread_table} ({', '.join(columns)}) VALUES %s",
+                           list(spread_df.itertuples(index=False, name=None)), page_size=1000)
+            self.conn.commit()
+            logging.info(f"Inserted {len(spread_df)} rows into {self.spread_table} table.")
+            return len(spread_df)
+        except Exception as e:
+            logging.error(f"Failed to insert data: {e}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
+
+    def _create_indicator_table(self):
+        cursor = self.conn.cursor()
+        try:
+            indicator_definitions = ',\n'.join(f"{col} DOUBLE PRECISION" for col in ['close'] + indicator_columns())
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.indicator_table} (
+                symbol VARCHAR(50) NOT NULL,
+                date TIMESTAMPTZ NOT NULL,
+                {indicator_definitions},
+                PRIMARY KEY (symbol, date)
+            );
+            CREATE INDEX IF NOT EXISTS {self.indicator_table}_date_idx ON {self.indicator_table} (date);
+            """)
+            self.conn.commit()
+            logging.info(f"{self.indicator_table} table created successfully.")
+        except Exception as e:
+            logging.error(f"Failed to create table: {str(e)}")
+            self.conn.rollback()
+        finally:
+            cursor.close()
+
+    def fetch_indicator_input_data(self, warmup_days=INDICATOR_WARMUP_DAYS):
+        '''(symbol, date, high, low, close) of the price table, input of calculate_indicators.
+           symbols already in the indicator table only load warmup_days before their latest stored date: enough
+           for the rolling windows and for the recursive EMA / Wilder averages to converge'''
+        self._create_indicator_table()
+        return pd.read_sql(f"""
+        WITH stored AS (
+            SELECT symbol, MAX(date) AS last_date FROM {self.indicator_table} GROUP BY symbol
+        )
+        SELECT a.symbol, a.date, a.high::float AS high, a.low::float AS low, a.close::float AS close
+        FROM {self.price_table} a
+        LEFT JOIN stored s ON a.symbol = s.symbol
+        WHERE s.last_date IS NULL OR a.date > s.last_date - INTERVAL '{warmup_days} days'
+        ORDER BY a.symbol, a.date
+        """, self.conn)
+
+    def insert_indicator_data(self, indicator_df, settle_days=INDICATOR_SETTLE_DAYS):
+        '''upsert the calculate_indicators rows newer than each symbol's latest stored date minus settle_days
+           (the warmup rows are already stored), returns the row count'''
+        self._create_indicator_table()
+        stored = pd.read_sql(f"""
+        SELECT symbol, MAX(date) - INTERVAL '{settle_days} days' AS cutoff FROM {self.indicator_table} GROUP BY symbol
+        """, self.conn)
+        cutoff = pd.to_datetime(indicator_df['symbol'].map(dict(zip(stored['symbol'], stored['cutoff']))), utc=True)
+        indicator_df = indicator_df[cutoff.isna() | (pd.to_datetime(indicator_df['date'], utc=True) > cutoff)]
+
+        columns = ['symbol', 'date', 'close'] + indicator_columns()
+        indicator_df = indicator_df[columns].astype(object).where(indicator_df[columns].notna(), None)
+        cursor = self.conn.cursor()
+        try:
+            execute_values(cursor, f"""
+            INSERT INTO {self.indicator_table} ({', '.join(columns)}) VALUES %s
+            ON CONFLICT (symbol, date) DO UPDATE SET
+            {', '.join(f"{col} = EXCLUDED.{col}" for col in columns[2:])}
+            """, list(indicator_df.itertuples(index=False, name=None)), page_size=1000)
+            self.conn.commit()
+            logging.info(f"Inserted/Updated {len(indicator_df)} rows in {self.indicator_table} table.")
+            return len(indicator_df)
+        except Exception as e:
+            logging.error(f"Failed to insert data: {e}")
+            self.conn.rollback()
+            return 0
+        finally:
+            cursor.close()
+
+    def fetch_key_insights(self, min_potential_win_pct=MIN_POTENTIAL_WIN_PCT, min_recent_coint=MIN_RECENT_COINT, min_r_squared=MIN_R_SQUARED):
+        '''the sql/AUTO_KEY_INSIGHTS.sql result, read from the spread table'''
+        return pd.read_sql(f"""
+        SELECT symbol1 AS symbol_a, symbol2 AS symbol_b, date,
+        round(most_recent_coint_pct, 2) AS most_recent_coint_pct, round(recent_coint_pct, 2) AS recent_coint_pct,
+        round(hist_coint_pct, 2) AS hist_coint_pct, round(r_squared, 2) AS r_squared,
+        round(ols_constant, 2) AS ols_constant, round(ols_coeff, 3) AS ols_coeff,
+        round(potential_win_pct::numeric, 4) AS potential_win_pct, round(key_score::numeric, 0) AS key_score,
+        round(investment::numeric, 2) AS investment, round(potential_win::numeric, 2) AS potential_win,
+        signal, position, round(backtest_return_pct::numeric, 4) AS backtest_return_pct, trades, win_rate
+        FROM {self.spread_table}
+        WHERE potential_win_pct >= {min_potential_win_pct}
+        AND most_recent_coint_pct >= {min_recent_coint}
+        AND r_squared >= {min_r_squared}
+        ORDER BY most_recent_coint_pct DESC, recent_coint_pct DESC, hist_coint_pct DESC, potential_win_pct DESC
+        """, self.conn)
+
     @abstractmethod
     def fetch_input_data(self):
         pass
@@ -63,9 +495,8 @@ class coin_stonewell_signal_updater(db_signal_updater):
     '''input data: top 20 coins
        calculation:    
     '''
-    def fetch_input_data(self, top_n_tickers):
-        query = f"""
-        WITH top_tickers AS (
+    def _top_tickers_query(self, top_n_tickers):
+        return f"""
             SELECT DISTINCT a.symbol, market_cap
             FROM binance_coin_historical_price a
             join coin_overview b
@@ -73,14 +504,29 @@ class coin_stonewell_signal_updater(db_signal_updater):
             WHERE market_cap IS NOT NULL
             ORDER BY market_cap DESC 
             LIMIT {top_n_tickers}
+        """
+
+    def fetch_top_tickers(self, top_n_tickers):
+        return pd.read_sql(self._top_tickers_query(top_n_tickers), self.conn)['symbol'].tolist()
+
+    def fetch_input_data(self, top_n_tickers, last_dates=None):
+        '''last_dates: {symbol: last date already in the indicator state}, only newer bars are loaded for those symbols'''
+        last_dates = last_dates or {}
+        query = f"""
+        WITH top_tickers AS ({self._top_tickers_query(top_n_tickers)}),
+        indicator_state AS (
+            SELECT * FROM unnest(%(symbols)s::text[], %(last_dates)s::date[]) AS s(symbol, last_date)
         )
         SELECT a.*
         FROM binance_coin_historical_price a 
         JOIN top_tickers b ON a.symbol = b.symbol
+        LEFT JOIN indicator_state s ON a.symbol = s.symbol
         WHERE date >= '2020-01-01'
+        AND (s.last_date IS NULL OR a.date > s.last_date)
         order by date
         """
-        return pd.read_sql(query, self.conn)
+        params = {'symbols': list(last_dates.keys()), 'last_dates': list(last_dates.values())}
+        return pd.read_sql(query, self.conn, params=params)
 
     def _create_signal_data_table(self):
         cursor = self.conn.cursor()
@@ -109,6 +555,8 @@ class coin_stonewell_signal_updater(db_signal_updater):
     def insert_signal_data_table(self, signal_df):
         self._create_signal_data_table()
         
+        # extra registered rules are not stored in the table
+        signal_df = signal_df[['symbol', 'close_above_sma', 'close_above_sma_pct', 'rsi_above_sma', 'short_vol_above_long', 'death_cross', 'last_updated']]
         csv_as_tuple = list(signal_df.itertuples(index=False, name=None))
         cursor = self.conn.cursor()
         insert_query = """
@@ -137,6 +585,12 @@ class coin_stonewell_signal_updater(db_signal_updater):
 
 class stock_coint_db_signal_updater(db_signal_updater):
     '''inherit db_signal_updater with custom stock output table creation and output data insertion'''
+    output_table = 'stock_pairs_coint'
+    price_table = 'stock_historical_price'
+    signal_table = 'stock_signal'
+    spread_table = 'stock_pairs_spread'
+    indicator_table = 'stock_indicators'
+
     def fetch_input_data(self, top_n_tickers):
         query = f"""
         WITH top_tickers AS (
@@ -154,11 +608,13 @@ class stock_coint_db_signal_updater(db_signal_updater):
         """
         return pd.read_sql(query, self.conn)
 
-    def _create_output_data_table(self):
+    def _create_output_data_table(self, start_date=None, end_date=None):
+        if self.partitioned_output:
+            return self._create_partitioned_output_table(start_date, end_date)
         cursor = self.conn.cursor()
         try:
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS stock_pairs_coint (
+            create_table_query = f"""
+            CREATE TABLE IF NOT EXISTS {self.output_table} (
                 date TIMESTAMPTZ NOT NULL,
                 window_length INT NOT NULL,
                 symbol1 VARCHAR(50) NOT NULL,
@@ -169,37 +625,13 @@ class stock_coint_db_signal_updater(db_signal_updater):
             """
             cursor.execute(create_table_query)
             self.conn.commit()
-            logging.info("stock_pairs_coint table created successfully.")
+            logging.info(f"{self.output_table} table created successfully.")
         except Exception as e:
             logging.error(f"Failed to create table: {str(e)}")
             self.conn.rollback()
         finally:
             cursor.close()
             
-    def insert_output_data(self, output_df):
-        self._create_output_data_table()
-        
-        csv_as_tuple = list(output_df.itertuples(index=False, name=None))
-        cursor = self.conn.cursor()
-        insert_query = """
-        INSERT INTO stock_pairs_coint (date, window_length, symbol1, symbol2, pvalue)
-        VALUES %s
-        ON CONFLICT (date, window_length, symbol1, symbol2)
-        DO UPDATE SET 
-            pvalue = EXCLUDED.pvalue
-        """
-        try:      
-            chunk_size = 1000  # Increased chunk size for better performance
-            for i in range(0, len(csv_as_tuple), chunk_size):
-                execute_values(cursor, insert_query, csv_as_tuple[i:i+chunk_size])
-            self.conn.commit()
-            logging.info(f"Inserted {len(csv_as_tuple)} rows into stock_pairs_coint table.")
-        except Exception as e:
-            logging.error(f"Failed to insert data: {e}")
-            self.conn.rollback()
-        finally:
-            cursor.close()
-
     def _create_signal_data_table(self):
         cursor = self.conn.cursor()
         try:
@@ -243,14 +675,19 @@ class stock_coint_db_signal_updater(db_signal_updater):
             r_squared = EXCLUDED.r_squared,
             ols_constant = EXCLUDED.ols_constant,
             ols_coeff = EXCLUDED.ols_coeff,
-            last_updated = EXCLUDED.last_updated;
+            last_updated = EXCLUDED.last_updated
+        WHERE (stock_signal.most_recent_coint_pct, stock_signal.recent_coint_pct, stock_signal.hist_coint_pct, stock_signal.r_squared, stock_signal.ols_constant, stock_signal.ols_coeff)
+            IS DISTINCT FROM (EXCLUDED.most_recent_coint_pct, EXCLUDED.recent_coint_pct, EXCLUDED.hist_coint_pct, EXCLUDED.r_squared, EXCLUDED.ols_constant, EXCLUDED.ols_coeff)
+        RETURNING symbol1, symbol2, window_length;
         """
         try:      
             chunk_size = 1000  # Increased chunk size for better performance
+            changed_rows = []
             for i in range(0, len(csv_as_tuple), chunk_size):
-                execute_values(cursor, insert_query, csv_as_tuple[i:i+chunk_size])
+                changed_rows += execute_values(cursor, insert_query, csv_as_tuple[i:i+chunk_size], fetch=True)
             self.conn.commit()
-            logging.info(f"Inserted/Updated {len(csv_as_tuple)} rows in stock_signal table.")
+            self._track_changed_signals(changed_rows)
+            logging.info(f"Inserted/Updated {len(changed_rows)} of {len(csv_as_tuple)} rows in stock_signal table.")
         except Exception as e:
             logging.error(f"Failed to insert data: {e}")
             self.conn.rollback()
@@ -289,12 +726,8 @@ class stock_coint_db_signal_updater(db_signal_updater):
         finally:
             cursor.close()
 
-    def insert_api_output_data(self):
-        self._create_api_output_table()
-        cursor = self.conn.cursor()
-        try:
-            insert_data_query = """
-            INSERT INTO stock_signal_api_output (symbol1, market_cap_1, pe_ratio_1, target_price_1, symbol2, market_cap_2, pe_ratio_2, target_price_2, most_recent_coint_pct, recent_coint_pct, hist_coint_pct, r_squared, ols_constant, ols_coeff, last_updated)
+    def _api_output_select(self, where_clause='TRUE'):
+        return f"""
             SELECT 
                 a.symbol1, 
                 b.MarketCapitalization AS market_cap_1, 
@@ -317,8 +750,32 @@ class stock_coint_db_signal_updater(db_signal_updater):
                 stock_overview b ON a.symbol1 = b.symbol
             JOIN 
                 stock_overview c ON a.symbol2 = c.symbol
-            ORDER BY 
-                a.most_recent_coint_pct DESC
+            LEFT JOIN 
+                stock_signal_api_output o ON a.symbol1 = o.symbol1 AND a.symbol2 = o.symbol2
+            WHERE 
+                a.window_length = {ROLLING_COINT_WINDOW}
+                AND ({where_clause})
+            """
+
+    def insert_api_output_data(self, swap=False):
+        '''incremental refresh: upsert only pairs whose signal changed in this run, that are missing, or whose overview
+           fields drifted from the api row. swap=True rebuilds the whole table in a shadow table and renames it in.
+           returns the number of rows written, 0 on failure'''
+        columns = "symbol1, market_cap_1, pe_ratio_1, target_price_1, symbol2, market_cap_2, pe_ratio_2, target_price_2, most_recent_coint_pct, recent_coint_pct, hist_coint_pct, r_squared, ols_constant, ols_coeff, last_updated"
+        if swap:
+            return self._swap_api_output_table('stock_signal_api_output', columns, self._api_output_select())
+        self._create_api_output_table()
+        cursor = self.conn.cursor()
+        try:
+            # api output keeps one row per pair: the primary window
+            changed_filter, params = self._changed_pairs_filter(['most_recent_coint_pct', 'recent_coint_pct', 'hist_coint_pct', 'r_squared', 'ols_constant', 'ols_coeff'])
+            where_clause = f"""{changed_filter}
+                OR o.symbol1 IS NULL
+                OR (b.MarketCapitalization, b.PERatio, b.AnalystTargetPrice, c.MarketCapitalization, c.PERatio, c.AnalystTargetPrice)
+                    IS DISTINCT FROM (o.market_cap_1, o.pe_ratio_1, o.target_price_1, o.market_cap_2, o.pe_ratio_2, o.target_price_2)"""
+            insert_data_query = f"""
+            INSERT INTO stock_signal_api_output ({columns})
+            {self._api_output_select(where_clause)}
             ON CONFLICT (symbol1, symbol2) 
             DO UPDATE SET 
             market_cap_1 = EXCLUDED.market_cap_1,
@@ -335,12 +792,14 @@ class stock_coint_db_signal_updater(db_signal_updater):
             ols_coeff = EXCLUDED.ols_coeff,
             last_updated = EXCLUDED.last_updated;
             """
-            cursor.execute(insert_data_query)
+            cursor.execute(insert_data_query, params)
             self.conn.commit()
-            logging.info("stock_signal_api_output data inserted/updated successfully.")
+            logging.info(f"stock_signal_api_output data inserted/updated successfully ({cursor.rowcount} rows).")
+            return cursor.rowcount
         except Exception as e:
             logging.error(f"Failed to insert/update data: {str(e)}")
             self.conn.rollback()
+            return 0
         finally:
             cursor.close()
             logging.info("API data update process completed.")
@@ -371,6 +830,12 @@ class stock_coint_by_segment_db_signal_updater(stock_coint_db_signal_updater):
     
 class coin_coint_db_signal_updater(db_signal_updater):
     '''inherit db_signal_updater with custom crypto output table creation and output data insertion'''
+    output_table = 'coin_pairs_coint'
+    price_table = 'coin_historical_price'
+    signal_table = 'coin_signal'
+    spread_table = 'coin_pairs_spread'
+    indicator_table = 'coin_indicators'
+
     def fetch_input_data(self, top_n_tickers):
         query = f"""
         with top_tickers as (
@@ -390,11 +855,13 @@ class coin_coint_db_signal_updater(db_signal_updater):
         """
         return pd.read_sql(query, self.conn)
 
-    def _create_output_data_table(self):
+    def _create_output_data_table(self, start_date=None, end_date=None):
+        if self.partitioned_output:
+            return self._create_partitioned_output_table(start_date, end_date)
         cursor = self.conn.cursor()
         try:
-            create_table_query = """
-            CREATE TABLE IF NOT EXISTS coin_pairs_coint (
+            create_table_query = f"""
+            CREATE TABLE IF NOT EXISTS {self.output_table} (
                 date TIMESTAMPTZ NOT NULL,
                 window_length INT NOT NULL,
                 symbol1 VARCHAR(50) NOT NULL,
@@ -405,37 +872,13 @@ class coin_coint_db_signal_updater(db_signal_updater):
             """
             cursor.execute(create_table_query)
             self.conn.commit()
-            logging.info("coin_pairs_coint table created successfully.")
+            logging.info(f"{self.output_table} table created successfully.")
         except Exception as e:
             logging.error(f"Failed to create table: {str(e)}")
             self.conn.rollback()
         finally:
             cursor.close()
             
-    def insert_output_data(self, output_df):
-        self._create_output_data_table()
-        
-        csv_as_tuple = list(output_df.itertuples(index=False, name=None))
-        cursor = self.conn.cursor()
-        insert_query = """
-        INSERT INTO coin_pairs_coint (date, window_length, symbol1, symbol2, pvalue)
-        VALUES %s
-        ON CONFLICT (date, window_length, symbol1, symbol2)
-        DO UPDATE SET 
-            pvalue = EXCLUDED.pvalue
-        """
-        try:      
-            chunk_size = 1000  # Increased chunk size for better performance
-            for i in range(0, len(csv_as_tuple), chunk_size):
-                execute_values(cursor, insert_query, csv_as_tuple[i:i+chunk_size])
-            self.conn.commit()
-            logging.info(f"Inserted {len(csv_as_tuple)} rows into coin_pairs_coint table.")
-        except Exception as e:
-            logging.error(f"Failed to insert data: {e}")
-            self.conn.rollback()
-        finally:
-            cursor.close()
-
     def _create_signal_data_table(self):
         cursor = self.conn.cursor()
         try:
@@ -479,14 +922,19 @@ class coin_coint_db_signal_updater(db_signal_updater):
             r_squared = EXCLUDED.r_squared,
             ols_constant = EXCLUDED.ols_constant,
             ols_coeff = EXCLUDED.ols_coeff,
-            last_updated = EXCLUDED.last_updated;
+            last_updated = EXCLUDED.last_updated
+        WHERE (coin_signal.most_recent_coint_pct, coin_signal.recent_coint_pct, coin_signal.hist_coint_pct, coin_signal.r_squared, coin_signal.ols_constant, coin_signal.ols_coeff)
+            IS DISTINCT FROM (EXCLUDED.most_recent_coint_pct, EXCLUDED.recent_coint_pct, EXCLUDED.hist_coint_pct, EXCLUDED.r_squared, EXCLUDED.ols_constant, EXCLUDED.ols_coeff)
+        RETURNING symbol1, symbol2, window_length;
         """
         try:      
             chunk_size = 1000  # Increased chunk size for better performance
+            changed_rows = []
             for i in range(0, len(csv_as_tuple), chunk_size):
-                execute_values(cursor, insert_query, csv_as_tuple[i:i+chunk_size])
+                changed_rows += execute_values(cursor, insert_query, csv_as_tuple[i:i+chunk_size], fetch=True)
             self.conn.commit()
-            print(f"Inserted/Updated {len(csv_as_tuple)} rows in coin_signal table.")
+            self._track_changed_signals(changed_rows)
+            print(f"Inserted/Updated {len(changed_rows)} of {len(csv_as_tuple)} rows in coin_signal table.")
         except Exception as e:
             print(f"Failed to insert data: {e}")
             self.conn.rollback()
@@ -523,12 +971,8 @@ class coin_coint_db_signal_updater(db_signal_updater):
         finally:
             cursor.close()
 
-    def insert_api_output_data(self):
-        self._create_api_output_table()
-        cursor = self.conn.cursor()
-        try:
-            insert_data_query = """
-        INSERT INTO coin_signal_api_output (symbol1, name1, market_cap_1, symbol2, name2, market_cap_2, most_recent_coint_pct, recent_coint_pct, hist_coint_pct, r_squared, ols_constant, ols_coeff, last_updated)
+    def _api_output_select(self, where_clause='TRUE'):
+        return f"""
         SELECT distinct
             a.symbol1, 
             b.name as name1,
@@ -549,8 +993,31 @@ class coin_coint_db_signal_updater(db_signal_updater):
             coin_overview b ON a.symbol1 = b.symbol
         JOIN 
             coin_overview c ON a.symbol2 = c.symbol
-        ORDER BY 
-            a.most_recent_coint_pct DESC
+        LEFT JOIN 
+            coin_signal_api_output o ON a.symbol1 = o.symbol1 AND b.name = o.name1 AND a.symbol2 = o.symbol2 AND c.name = o.name2
+        WHERE 
+            a.window_length = {ROLLING_COINT_WINDOW}
+            AND ({where_clause})
+        """
+
+    def insert_api_output_data(self, swap=False):
+        '''incremental refresh: upsert only pairs whose signal changed in this run, that are missing, or whose market caps
+           drifted from the api row. swap=True rebuilds the whole table in a shadow table and renames it in.
+           returns the number of rows written, 0 on failure'''
+        columns = "symbol1, name1, market_cap_1, symbol2, name2, market_cap_2, most_recent_coint_pct, recent_coint_pct, hist_coint_pct, r_squared, ols_constant, ols_coeff, last_updated"
+        if swap:
+            return self._swap_api_output_table('coin_signal_api_output', columns, self._api_output_select())
+        self._create_api_output_table()
+        cursor = self.conn.cursor()
+        try:
+            # api output keeps one row per pair: the primary window
+            changed_filter, params = self._changed_pairs_filter(['most_recent_coint_pct', 'recent_coint_pct', 'hist_coint_pct', 'r_squared', 'ols_constant', 'ols_coeff'])
+            where_clause = f"""{changed_filter}
+            OR o.symbol1 IS NULL
+            OR (b.market_cap, c.market_cap) IS DISTINCT FROM (o.market_cap_1, o.market_cap_2)"""
+            insert_data_query = f"""
+        INSERT INTO coin_signal_api_output ({columns})
+        {self._api_output_select(where_clause)}
         ON CONFLICT (symbol1, name1, symbol2, name2)
         DO UPDATE SET 
         market_cap_1 = EXCLUDED.market_cap_1,
@@ -563,13 +1030,87 @@ class coin_coint_db_signal_updater(db_signal_updater):
         ols_coeff = EXCLUDED.ols_coeff,
         last_updated = EXCLUDED.last_updated;
         """
-            cursor.execute(insert_data_query)
+            cursor.execute(insert_data_query, params)
             self.conn.commit()
-            print("coin_signal_api_output data inserted/updated successfully.")
+            print(f"coin_signal_api_output data inserted/updated successfully ({cursor.rowcount} rows).")
+            return cursor.rowcount
         except Exception as e:
             print(f"Failed to insert/update data: {str(e)}")
             self.conn.rollback()
+            return 0
         finally:
             cursor.close()
             print("API data update process completed.")
-                     
\ No newline at end of file
+                     
+
+
+def _benchmark_copy(db_credentials):
+    '''insert_output_data, execute_values vs binary COPY, on a scratch copy of coin_pairs_coint'''
+    rng = np.random.default_rng(0)
+    n_symbols, n_dates = 64, 250 # 2016 pairs x 250 dates ~ 500k rows
+    symbols = [f'SYM{i}' for i in range(n_symbols)]
+    pairs = [(s1, s2) for i, s1 in enumerate(symbols) for s2 in symbols[i+1:]]
+    dates = pd.date_range('2024-01-01', periods=n_dates)
+    bench_df = pd.DataFrame({
+        'date': np.tile(dates, len(pairs)),
+        'window_length': ROLLING_COINT_WINDOW,
+        'symbol1': np.repeat([p[0] for p in pairs], n_dates),
+        'symbol2': np.repeat([p[1] for p in pairs], n_dates),
+        'value': rng.random(len(pairs) * n_dates),
+    })
+
+    db = coin_coint_db_signal_updater(*db_credentials)
+    db.connect()
+    db.output_table = 'bench_pairs_coint'
+    for bulk in (False, True):
+        for run in ('insert', 'upsert'): # empty table, then every row conflicts
+            start = time.perf_counter()
+            db.insert_output_data(bench_df, bulk=bulk)
+            elapsed = time.perf_counter() - start
+            print(f"{'copy' if bulk else 'execute_values':>14} {run}: {len(bench_df)} rows in {elapsed:.1f}s, {len(bench_df) / elapsed:,.0f} rows/sec")
+        cursor = db.conn.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {db.output_table}")
+        db.conn.commit()
+        cursor.close()
+    db.close()
+
+def _benchmark_spread(db_credentials):
+    '''sql/AUTO_KEY_INSIGHTS.sql vs pairs_spread_signal_calculator + coin_pairs_spread'''
+    import os
+    from utils.refactor_signal_calculator import pairs_spread_signal_calculator
+    sql_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sql', 'AUTO_KEY_INSIGHTS.sql')
+    with open(sql_path) as file:
+        query = file.read().format(MIN_POTENTIAL_WIN_PCT=MIN_POTENTIAL_WIN_PCT, MIN_RECENT_COINT=MIN_RECENT_COINT, MIN_R_SQUARED=MIN_R_SQUARED)
+
+    with coin_coint_db_signal_updater(*db_credentials) as db:
+        start = time.perf_counter()
+        sql_df = pd.read_sql(query, db.conn)
+        sql_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        price_df, pair_signal_df = db.fetch_spread_input_data()
+        fetch_seconds = time.perf_counter() - start
+        calc = pairs_spread_signal_calculator(price_df, pair_signal_df)
+        spread_df = calc.calculate_signal(calc.calculate_data())
+        calc_seconds = time.perf_counter() - start - fetch_seconds
+        db.insert_spread_data(spread_df)
+        python_df = db.fetch_key_insights()
+        python_seconds = time.perf_counter() - start
+
+    # the sql joins every window_length of coin_signal, the engine uses ROLLING_COINT_WINDOW
+    sql_pairs = set(zip(sql_df['symbol_a'], sql_df['symbol_b']))
+    python_pairs = set(zip(python_df['symbol_a'], python_df['symbol_b']))
+    print(f"sql: {len(sql_pairs)} pairs in {sql_seconds:.1f}s")
+    print(f"python: {len(spread_df)} pairs computed, {len(python_pairs)} key insights in {python_seconds:.1f}s "
+          f"(fetch {fetch_seconds:.1f}s, calculation {calc_seconds:.2f}s)")
+    print(f"pairs only in sql: {len(sql_pairs - python_pairs)}, only in python: {len(python_pairs - sql_pairs)}")
+
+if __name__ == "__main__":
+    # run from src/: python -m utils.refactor_db_signal_updater [copy|spread]
+    from dotenv import load_dotenv
+    import os
+    import sys
+    load_dotenv(override=True)
+    db_credentials = ('financial_data', os.getenv('RDS_ENDPOINT'), os.getenv('RDS_USERNAME'), os.getenv('RDS_PASSWORD'))
+    benchmark = sys.argv[1] if len(sys.argv) > 1 else 'copy'
+    {'copy': _benchmark_copy, 'spread': _benchmark_spread}[benchmark](db_credentials)
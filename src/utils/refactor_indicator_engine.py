@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import logging
+import warnings
+import numpy as np
+import pandas as pd
+from config import *
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)8s | %(message)s',
+    datefmt='%Y-%m-%d %H:%M' #datefmt='%Y-%m-%d %H:%M:%S'
+)
+
+'''MATRIX INDICATORS'''
+# every function takes (bars x symbols) float matrices, rows in time order, and computes all symbols at once.
+# NaN marks a missing bar: a rolling window holding one is NaN (pandas rolling(window) semantics), the recursive
+# indicators (EMA, Wilder) skip it and carry their state to the next bar.
+# long price data with staggered listings goes through grouped_indicator_engine.to_matrix first, so a window
+# counts a symbol's own bars.
+
+def _prefix_sums(values, squares=False):
+    '''prefix sums of the (column centred) values, optionally of their squares, and of the valid counts'''
+    valid = ~np.isnan(values)
+    # centre every column first so long running sums don't cancel out on large prices
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        centre = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(values.shape[1])
+    x = np.where(valid, values - centre, 0.0)
+    def prefix(a):
+        output = np.zeros((len(a) + 1, a.shape[1]))
+        np.cumsum(a, axis=0, out=output[1:])
+        return output
+    return centre, prefix(x), prefix(x * x) if squares else None, prefix(valid.astype(float))
+
+def rolling_mean(values, windows):
+    '''simple moving average for every window from one prefix sum pass: {window: matrix}.
+       NaN until the window is full or when it holds a NaN, same as pandas rolling(window).mean()'''
+    centre, csum, _, ccount = _prefix_sums(values)
+    results = {}
+    for window in windows:
+        output = np.full(values.shape, np.nan)
+        if window <= len(values):
+            # row i covers prefix rows (i + 1 - window, i + 1]
+            total = csum[window:] - csum[:-window]
+            full = (ccount[window:] - ccount[:-window]) == window
+            output[window - 1:] = np.where(full, total / window + centre, np.nan)
+        results[window] = output
+    return results
+
+def rolling_mean_std(values, window, min_periods=1):
+    '''rolling mean and sample std over the last `window` rows, NaN rows skipped like pandas
+       rolling(window, min_periods). std is 0 for a single observation (coalesce(stddev, 0) in postgres)'''
+    centre, csum, csum_sq, ccount = _prefix_sums(values, squares=True)
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    count = ccount[ends] - ccount[starts]
+    total = csum[ends] - csum[starts]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        var = (csum_sq[ends] - csum_sq[starts] - total * mean) / (count - 1)
+    std = np.where(count > 1, np.sqrt(np.clip(var, 0, None)), 0.0)
+    enough = count >= max(min_periods, 1)
+    return np.where(enough, mean + centre, np.nan), np.where(enough, std, np.nan)
+
+def ema(values, span):
+    '''exponential moving average, alpha = 2 / (span + 1), seeded with the first bar of each symbol.
+       same as pandas ewm(span=span, adjust=False).mean() on gapless data'''
+    alpha = 2 / (span + 1)
+    output = np.full(values.shape, np.nan)
+    state = np.full(values.shape[1], np.nan)
+    for row, x in enumerate(values):
+        valid = ~np.isnan(x)
+        state = np.where(valid, np.where(np.isnan(state), x, state + alpha * (x - state)), state)
+        output[row] = np.where(valid, state, np.nan)
+    return output
+
+def wilder_smooth(values, period):
+    '''Wilder's moving average: the mean of the first `period` values, then avg += (value - avg) / period'''
+    valid = ~np.isnan(values)
+    seen = np.cumsum(valid, axis=0)
+    seed = np.cumsum(np.where(valid, values, 0.0), axis=0) / period
+    output = np.full(values.shape, np.nan)
+    state = np.full(values.shape[1], np.nan)
+    for row, x in enumerate(values):
+        state = np.where(valid[row] & (seen[row] == period), seed[row],
+                         np.where(valid[row] & (seen[row] > period), state + (x - state) / period, state))
+        output[row] = np.where(valid[row] & (seen[row] >= period), state, np.nan)
+    return output
+
+def _changes(close):
+    delta = np.full(close.shape, np.nan)
+    delta[1:] = close[1:] - close[:-1]
+    return delta
+
+def simple_rsi(close, period):
+    '''RSI from simple means of gains and losses over `period` bars, the first bar of a symbol counts as zero change
+       (the stonewell / sql/trend_base_strat_analysis.sql definition)'''
+    delta = _changes(close)
+    listed = np.maximum.accumulate(~np.isnan(close), axis=0)
+    gain = np.where(listed, np.where(delta > 0, delta, 0.0), np.nan)
+    loss = np.where(listed, np.where(delta < 0, -delta, 0.0), np.nan)
+    avg_gain = rolling_mean(gain, [period])[period]
+    avg_loss = rolling_mean(loss, [period])[period]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+def wilder_rsi(close, period):
+    '''Wilder's RSI: gains and losses smoothed with wilder_smooth, first value after `period` changes'''
+    delta = _changes(close)
+    avg_gain = wilder_smooth(np.where(np.isnan(delta), np.nan, np.maximum(delta, 0.0)), period)
+    avg_loss = wilder_smooth(np.where(np.isnan(delta), np.nan, np.maximum(-delta, 0.0)), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 * avg_gain / (avg_gain + avg_loss)
+
+def bollinger_bands(close, window, num_sd):
+    '''(middle, upper, lower): rolling mean +- num_sd sample standard deviations over full windows'''
+    mean, std = rolling_mean_std(close, window, min_periods=window)
+    return mean, mean + num_sd * std, mean - num_sd * std
+
+def average_true_range(high, low, close, period):
+    '''Wilder ATR. true range = max(high - low, |high - previous close|, |low - previous close|),
+       high - low on the first bar of a symbol'''
+    previous_close = np.full(close.shape, np.nan)
+    previous_close[1:] = close[:-1]
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+    true_range[np.isnan(high - low)] = np.nan
+    return wilder_smooth(true_range, period)
+
+def indicator_columns(sma_periods=INDICATOR_SMA_PERIODS, ema_spans=INDICATOR_EMA_SPANS, rsi_period=INDICATOR_RSI_PERIOD,
+                      bb_window=INDICATOR_BB_WINDOW, atr_period=INDICATOR_ATR_PERIOD):
+    '''names of the calculate_indicators output columns, in order'''
+    return ([f'sma_{period}' for period in sma_periods] + [f'ema_{span}' for span in ema_spans]
+            + [f'rsi_{rsi_period}', f'wilder_rsi_{rsi_period}']
+            + [f'bb_{band}_{bb_window}' for band in ['middle', 'upper', 'lower']] + [f'atr_{atr_period}'])
+
+def calculate_indicators(df, sma_periods=INDICATOR_SMA_PERIODS, ema_spans=INDICATOR_EMA_SPANS, rsi_period=INDICATOR_RSI_PERIOD,
+                         bb_window=INDICATOR_BB_WINDOW, bb_sd=INDICATOR_BB_SD, atr_period=INDICATOR_ATR_PERIOD):
+    '''the shared indicator set of a long (symbol, date, high, low, close) frame, one row per input row:
+       sma_{n}, ema_{n}, rsi_{n} (simple), wilder_rsi_{n}, bb_middle/upper/lower_{n}, atr_{n}'''
+    engine = grouped_indicator_engine(df)
+    close = engine.to_matrix(df['close'])
+    columns = {}
+    for period, sma in rolling_mean(close, sma_periods).items():
+        columns[f'sma_{period}'] = sma
+    for span in ema_spans:
+        columns[f'ema_{span}'] = ema(close, span)
+    columns[f'rsi_{rsi_period}'] = simple_rsi(close, rsi_period)
+    columns[f'wilder_rsi_{rsi_period}'] = wilder_rsi(close, rsi_period)
+    middle, upper, lower = bollinger_bands(close, bb_window, bb_sd)
+    columns.update({f'bb_middle_{bb_window}': middle, f'bb_upper_{bb_window}': upper, f'bb_lower_{bb_window}': lower})
+    columns[f'atr_{atr_period}'] = average_true_range(engine.to_matrix(df['high']), engine.to_matrix(df['low']), close, atr_period)
+
+    output = df[['symbol', 'date', 'close']].copy()
+    for name, matrix in columns.items():
+        output[name] = engine.from_matrix(matrix)
+    return output
+
+
+'''INDICATOR ENGINE'''
+class grouped_indicator_engine:
+    '''sort long format price data by (symbol, date) once and lay every symbol's bars out as a column of a
+       (bars x symbols) matrix for the matrix indicators above. Results are scattered back in the input row order.
+    '''
+    def __init__(self, df, group_col='symbol', date_col='date'):
+        codes, _ = pd.factorize(df[group_col])
+        dates = pd.to_datetime(df[date_col]).to_numpy(dtype='datetime64[ns]').view('int64')
+        self.order = np.lexsort((dates, codes))
+        self.n = len(df)
+
+        # segment = contiguous run of one symbol after sorting
+        sorted_codes = codes[self.order]
+        is_start = np.ones(self.n, dtype=bool)
+        is_start[1:] = sorted_codes[1:] != sorted_codes[:-1]
+        self.segment_id = np.cumsum(is_start) - 1
+        self.segment_start = np.flatnonzero(is_start)
+        self.position = np.arange(self.n) - self.segment_start[self.segment_id]
+
+        # right aligned: every symbol's latest bar on the last row, shorter histories padded with NaN on top
+        lengths = np.bincount(self.segment_id) if self.n else np.zeros(0, dtype=int)
+        self.rows = int(lengths.max()) if self.n else 0
+        self.columns = len(self.segment_start)
+        matrix_row = self.rows - lengths[self.segment_id] + self.position
+        # flat matrix cell of every input row, to_matrix / from_matrix are one scatter / gather
+        self.cell = np.empty(self.n, dtype=np.int64)
+        self.cell[self.order] = matrix_row * self.columns + self.segment_id
+
+    def to_matrix(self, series):
+        '''(bars x symbols) matrix of a long column, row = position of the bar in its symbol'''
+        matrix = np.full(self.rows * self.columns, np.nan)
+        matrix[self.cell] = np.asarray(series, dtype=float)
+        return matrix.reshape(self.rows, self.columns)
+
+    def from_matrix(self, matrix):
+        '''long column in the input row order from a matrix laid out by to_matrix'''
+        return np.ascontiguousarray(matrix).ravel()[self.cell]
+
+
+class streaming_indicator_state:
+    '''the last `tail_length` closes and volumes of every symbol saved to a json file, so a refresh only loads the
+       bars that arrived since the last run instead of the whole history. the latest indicator row of every symbol is
+       computed by the matrix indicators above (rolling_mean, simple_rsi) on a (tail_length x symbols) matrix, the
+       same math as the batch calculation; tail_length covers the longest window, RSI SMAs included.
+       Bars within settle_days of the newest bar are provisional (the daily download re-pulls and can restate them):
+       they are used for the returned rows but not stored, and fed again on the next run.
+    '''
+    def __init__(self, state_file_path, close_sma_periods, volume_sma_periods, rsi_period, rsi_sma_periods, settle_days=5):
+        self.state_file_path = state_file_path
+        self.settle_days = settle_days
+        # the first bar of a tail counts as zero change, the RSIs the SMAs read start rsi_period bars after it
+        self.tail_length = max(list(close_sma_periods) + list(volume_sma_periods) + [rsi_period + max(rsi_sma_periods, default=1)])
+        self.params = {
+            'close_sma_periods': list(close_sma_periods),
+            'volume_sma_periods': list(volume_sma_periods),
+            'rsi_period': rsi_period,
+            'rsi_sma_periods': list(rsi_sma_periods),
+            'tail_length': self.tail_length,
+        }
+        self.symbols = {}
+
+        if os.path.exists(self.state_file_path):
+            with open(self.state_file_path, 'r') as file:
+                saved = json.load(file)
+            if saved.get('params') == self.params:
+                self.symbols = saved['symbols']
+                logging.info(f"Loaded indicator state for {len(self.symbols)} symbols")
+            else:
+                logging.warning("Indicator parameters changed, rebuilding state from full history")
+
+    def last_dates(self):
+        return {symbol: st['last_date'] for symbol, st in self.symbols.items()}
+
+    def save(self):
+        with open(self.state_file_path, 'w') as file:
+            json.dump({'params': self.params, 'symbols': self.symbols}, file)
+        logging.info(f"Saved indicator state for {len(self.symbols)} symbols")
+
+    def _tail_matrix(self, tails):
+        # right aligned like grouped_indicator_engine.to_matrix: the latest bar of every symbol on the last row
+        matrix = np.full((self.tail_length, len(tails)), np.nan)
+        for column, values in enumerate(tails):
+            if len(values):
+                matrix[-len(values):, column] = values
+        return matrix
+
+    def _latest_rows(self, tails):
+        '''tails: {symbol: (last_date, closes, volumes)} -> the latest indicator row per symbol'''
+        if not tails:
+            return pd.DataFrame()
+        names = list(tails)
+        close = self._tail_matrix([tails[symbol][1] for symbol in names])
+        volume = self._tail_matrix([tails[symbol][2] for symbol in names])
+        rsi_period = self.params['rsi_period']
+        output = pd.DataFrame({'symbol': names, 'date': pd.to_datetime([tails[symbol][0] for symbol in names]),
+                               'close': close[-1], 'volume': volume[-1]})
+        for window, sma in rolling_mean(close, self.params['close_sma_periods']).items():
+            output[f'close_sma_{window}'] = sma[-1]
+        for window, sma in rolling_mean(volume, self.params['volume_sma_periods']).items():
+            output[f'volume_sma_{window}'] = sma[-1]
+        rsi = simple_rsi(close, rsi_period)
+        output[f'rsi_{rsi_period}'] = rsi[-1]
+        for window, sma in rolling_mean(rsi, self.params['rsi_sma_periods']).items():
+            output[f'rsi_{rsi_period}_sma_{window}'] = sma[-1]
+        return output
+
+    def update(self, bars_df, symbols=None):
+        '''feed bars newer than each symbol's last_date and return the latest indicator row per symbol.
+           symbols limits the returned rows (e.g. the current top tickers), default is every symbol in state'''
+        bars = bars_df[['symbol', 'date', 'close', 'volume']].copy()
+        bars['date'] = pd.to_datetime(bars['date']).dt.strftime('%Y-%m-%d')
+        bars = bars.sort_values(['symbol', 'date'], kind='mergesort')
+        cutoff = None
+        if len(bars):
+            cutoff = (pd.Timestamp(bars['date'].max()) - pd.Timedelta(days=self.settle_days)).strftime('%Y-%m-%d')
+
+        tails = {}
+        for symbol, group in bars.groupby('symbol', sort=False):
+            st = self.symbols.get(symbol, {'last_date': None, 'closes': [], 'volumes': []})
+            if st['last_date'] is not None:
+                group = group[group['date'] > st['last_date']]
+            settled = group[group['date'] <= cutoff]
+            if len(settled):
+                st = self.symbols[symbol] = {
+                    'last_date': settled['date'].iloc[-1],
+                    'closes': (st['closes'] + settled['close'].astype(float).tolist())[-self.tail_length:],
+                    'volumes': (st['volumes'] + settled['volume'].astype(float).tolist())[-self.tail_length:],
+                }
+            provisional = group[group['date'] > cutoff]
+            if st['last_date'] is not None or len(provisional):
+                last_date = provisional['date'].iloc[-1] if len(provisional) else st['last_date']
+                tails[symbol] = (last_date,
+                                 (st['closes'] + provisional['close'].astype(float).tolist())[-self.tail_length:],
+                                 (st['volumes'] + provisional['volume'].astype(float).tolist())[-self.tail_length:])
+
+        for symbol, st in self.symbols.items():
+            if symbol not in tails:
+                tails[symbol] = (st['last_date'], st['closes'], st['volumes'])
+
+        if symbols is not None:
+            wanted = set(symbols)
+            tails = {symbol: tail for symbol, tail in tails.items() if symbol in wanted}
+        return self._latest_rows(tails)
+
+
+# Benchmark, run from src/: python -m utils.refactor_indicator_engine
+if __name__ == "__main__":
+    from utils.refactor_signal_calculator import stonewell_signal_calculator
+
+    def legacy_calculate_data(df):
+        '''the previous groupby/transform implementation, kept here for comparison'''
+        calc = stonewell_signal_calculator
+        def _calculate_rsi(data, period):
+            delta = data.diff()
+            gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+            loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+            rs = gain / loss
+            return 100 - (100 / (1 + rs))
+        df = df.copy()
+        for period in calc.CLOSE_SMA_PERIODS:
+            df[f'close_sma_{period}'] = df.groupby('symbol')['close'].transform(lambda x: x.rolling(window=period).mean())
+        for period in calc.VOLUME_SMA_PERIODS:
+            df[f'volume_sma_{period}'] = df.groupby('symbol')['volume'].transform(lambda x: x.rolling(window=period).mean())
+        df['rsi_14'] = df.groupby('symbol')['close'].transform(lambda x: _calculate_rsi(x, calc.RSI_PERIOD))
+        for period in calc.RSI_SMA_PERIODS:
+            df[f'rsi_14_sma_{period}'] = df.groupby('symbol')['rsi_14'].transform(lambda x: x.rolling(window=period).mean())
+        return df
+
+    # top 200 coin universe since 2020, listing dates staggered like the real table
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2020-01-01', pd.Timestamp.today().normalize(), freq='D')
+    frames = []
+    for i in range(200):
+        listed = dates[rng.integers(0, len(dates) // 2):]
+        close = np.exp(np.cumsum(rng.normal(0, 0.04, len(listed)))) * 10 ** rng.uniform(-6, 4)
+        volume = rng.lognormal(20, 1, len(listed))
+        frames.append(pd.DataFrame({'symbol': f'COIN{i}', 'date': listed, 'close': close, 'volume': volume}))
+    price_df = pd.concat(frames).sort_values('date', kind='mergesort').reset_index(drop=True)
+
+    start = time.perf_counter()
+    expected = legacy_calculate_data(price_df)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = stonewell_signal_calculator(price_df, None).calculate_data()
+    engine_time = time.perf_counter() - start
+
+    indicator_cols = [col for col in expected.columns if col not in price_df.columns]
+    pd.testing.assert_frame_equal(actual[indicator_cols], expected[indicator_cols], rtol=1e-8)
+    logging.info(f"{len(price_df)} rows x {len(indicator_cols)} indicators | groupby: {legacy_time:.2f}s | engine: {engine_time:.2f}s | {legacy_time / engine_time:.1f}x")
+
+    # shared indicator set against per symbol pandas / loop references
+    def wilder_reference(values, period):
+        output, avg = np.full(len(values), np.nan), np.nan
+        for i in range(period - 1, len(values)):
+            avg = np.mean(values[i - period + 1:i + 1]) if i == period - 1 else avg + (values[i] - avg) / period
+            output[i] = avg
+        return output
+
+    ohlc_df = price_df[price_df['symbol'].isin([f'COIN{i}' for i in range(20)])].copy()
+    ohlc_df['high'] = ohlc_df['close'] * (1 + rng.uniform(0, 0.05, len(ohlc_df)))
+    ohlc_df['low'] = ohlc_df['close'] * (1 - rng.uniform(0, 0.05, len(ohlc_df)))
+    start = time.perf_counter()
+    indicators = calculate_indicators(ohlc_df)
+    indicator_time = time.perf_counter() - start
+    for symbol, group in ohlc_df.groupby('symbol'):
+        actual = indicators.loc[group.index]
+        close = group['close']
+        expected = {f'sma_{n}': close.rolling(n).mean() for n in INDICATOR_SMA_PERIODS}
+        expected.update({f'ema_{n}': close.ewm(span=n, adjust=False).mean() for n in INDICATOR_EMA_SPANS})
+        delta = close.diff().to_numpy()[1:]
+        gain = wilder_reference(np.maximum(delta, 0), INDICATOR_RSI_PERIOD)
+        loss = wilder_reference(np.maximum(-delta, 0), INDICATOR_RSI_PERIOD)
+        expected[f'wilder_rsi_{INDICATOR_RSI_PERIOD}'] = np.concatenate([[np.nan], 100 * gain / (gain + loss)])
+        middle, std = close.rolling(INDICATOR_BB_WINDOW).mean(), close.rolling(INDICATOR_BB_WINDOW).std()
+        expected[f'bb_upper_{INDICATOR_BB_WINDOW}'] = middle + INDICATOR_BB_SD * std
+        expected[f'bb_lower_{INDICATOR_BB_WINDOW}'] = middle - INDICATOR_BB_SD * std
+        previous_close = close.shift()
+        true_range = np.fmax(group['high'] - group['low'], np.fmax((group['high'] - previous_close).abs(), (group['low'] - previous_close).abs()))
+        expected[f'atr_{INDICATOR_ATR_PERIOD}'] = wilder_reference(true_range.to_numpy(), INDICATOR_ATR_PERIOD)
+        for col, values in expected.items():
+            np.testing.assert_allclose(actual[col].to_numpy(), np.asarray(values, dtype=float), rtol=1e-7, err_msg=f"{symbol} {col}")
+    logging.info(f"calculate_indicators matches the per symbol references | {len(ohlc_df)} rows | {indicator_time:.2f}s")
+
+    # streaming state against the batch calculation: full history up to a date, then an incremental run
+    import tempfile
+    state_path = os.path.join(tempfile.mkdtemp(), 'stonewell_indicator_state.json')
+    split_date = price_df['date'].max() - pd.Timedelta(days=30)
+    state = stonewell_signal_calculator.load_indicator_state(state_path)
+    stonewell_signal_calculator(price_df[price_df['date'] <= split_date], None).calculate_latest_data(state)
+    state.save()
+    state = stonewell_signal_calculator.load_indicator_state(state_path)
+    start = time.perf_counter()
+    latest = stonewell_signal_calculator(price_df[price_df['date'] > split_date - pd.Timedelta(days=STONEWELL_STATE_SETTLE_DAYS)], None).calculate_latest_data(state)
+    streaming_time = time.perf_counter() - start
+    batch = stonewell_signal_calculator(price_df, None).calculate_data().groupby('symbol').last().reset_index()
+    latest, batch = latest.sort_values('symbol', ignore_index=True), batch.sort_values('symbol', ignore_index=True)
+    pd.testing.assert_frame_equal(latest[indicator_cols], batch[indicator_cols], rtol=1e-8)
+    logging.info(f"streaming state matches the batch latest rows | {len(latest)} symbols | {streaming_time * 1000:.0f}ms")